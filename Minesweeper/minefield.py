@@ -1,18 +1,33 @@
 import numpy as np
 
 
+# Value of a mine in the field, the other cells hold the number of neighbouring mines
+MINE = 9
+
+
 class Minefield:
-    def __init__(self, field_size:tuple[int, int], percent_mines:int):
+    def __init__(self, field_size:tuple[int, int], percent_mines:int, seed=None):
         """Representation for a minefield for the game Minesweeper.
 
         :param field_size: Size of the field (height x width)
         :param percent_mines: Amount of mines in percent (0 - 100)
+        :param seed: Seed for the random number generator placing the mines. None -> random seed.
         """
         self.field = None
         self.marker_field = None
+        self.rng = np.random.default_rng(seed)
+
+        # Connected regions of zero cells (see label_regions): runs of zeros per row as row, first and last column
+        # (exclusive) grouped by region, the runs of a region are region_offsets[region]:region_offsets[region+1].
+        # run_keys (row * width + first column) and run_regions locate the run of a cell, in row-major order.
+        self.region_runs = None
+        self.region_offsets = None
+        self.run_keys = None
+        self.run_regions = None
 
         self.field_size = field_size
-        self.amount_mines = max(1, int(field_size[0]*field_size[1] * percent_mines/100))
+        cell_count = field_size[0]*field_size[1]
+        self.amount_mines = min(max(1, int(cell_count * percent_mines/100)), cell_count)
         self.mines_left = self.amount_mines
 
         self.setup()
@@ -20,44 +35,109 @@ class Minefield:
     def setup(self):
         """ """
 
-        self.field = np.zeros(shape=self.field_size, dtype=int)
-        self.marker_field = np.zeros(shape=self.field_size, dtype=int)
+        # Small integers are enough for hints and markers and keep huge fields in memory
+        self.field = np.zeros(shape=self.field_size, dtype=np.int8)
+        self.marker_field = np.zeros(shape=self.field_size, dtype=np.int8)
 
         self.spawn_mines()
         self.setup_hints()
+        self.label_regions()
 
     def spawn_mines(self):
-        """ """
-        spawn_positions = np.argwhere(self.field == 0)
-        selection = np.random.choice(range(len(spawn_positions)), size=self.amount_mines, replace=False)
-
-        for index in selection:
-            x, y = spawn_positions[index]
-            # 1 marks a mine during spawning, will later be replaced with a 9
-            self.field[x][y] = 1
+        """Place exactly amount_mines mines at distinct random cells. For more than half of the cells the field is
+        filled with mines and the free cells are placed instead, so the random cells are mostly hit on the first try.
+        """
+        cells = self.field.reshape(-1)
+        if self.amount_mines > cells.size // 2:
+            cells[:] = MINE
+            place_randomly(cells, self.rng, cells.size - self.amount_mines, 0)
+        else:
+            place_randomly(cells, self.rng, self.amount_mines, MINE)
 
     def setup_hints(self):
-        """ """
-        padded_field = np.pad(self.field, ((1, 1), (1, 1)), mode='constant', constant_values=0)
-
-        # Kernel of ones
-        kernel = np.ones(shape=(3,3), dtype=int)
-        kernel[1][1] = 0
-        m, n = kernel.shape
-        x, y = self.field_size
-
-        for ii in range(x):
-            for jj in range(y):
-                if self.field[ii][jj] == 1:
-                    # Replace mine marker with 9 instead of 1 since 1 is now a hint marker
-                    self.field[ii][jj] = 9
-                else:
-                    # Basic convolution operation to count mines at neighbouring positions
-                    region = padded_field[ii:ii + m, jj:jj + n]
-                    hint = np.sum(region * kernel)
-                    self.field[ii][jj] = hint
-
-        self.amount_mines = len(np.argwhere(self.field == 9))
+        """Write the number of neighbouring mines into every cell that is not a mine: the sum of the mine mask shifted
+        into the 8 directions."""
+        height, width = self.field_size
+        mines = self.field == MINE
+        padded_mines = np.pad(mines, ((1, 1), (1, 1)), mode='constant', constant_values=False).view(np.int8)
+
+        hints = np.zeros(self.field_size, dtype=np.int8)
+        for dx in [0, 1, 2]:
+            for dy in [0, 1, 2]:
+                if dx != 1 or dy != 1:
+                    hints += padded_mines[dx:dx + height, dy:dy + width]
+
+        hints[mines] = MINE
+        self.field = hints
+
+    def label_regions(self):
+        """Label the connected (also diagonally) regions of zero cells, so a click on a zero cell reveals its region
+        at once (see reveal_region). The cells are grouped into runs of zeros per row first, runs of neighbouring rows
+        that touch are then joined into regions, all with vectorized operations.
+        """
+        height, width = self.field_size
+        zeros = np.zeros((height, width + 2), dtype=np.int8)
+        zeros[:, 1:-1] = self.field == 0
+        steps = np.diff(zeros, axis=1)
+        rows, starts = np.divmod(np.flatnonzero(steps == 1), width + 1)
+        ends = np.flatnonzero(steps == -1) % (width + 1)
+        run_count = len(rows)
+
+        # Runs in the next row that touch a run: last column >= start - 1 and first column <= end
+        first = np.searchsorted(rows * (width + 1) + ends, (rows + 1) * (width + 1) + starts, side='left')
+        last = np.searchsorted(rows * (width + 1) + starts, (rows + 1) * (width + 1) + ends, side='right')
+        counts = np.maximum(last - first, 0)
+        upper = np.repeat(np.arange(run_count), counts)
+        lower = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        # Union-find over the runs: every root points to the smaller root of a touching run until all touching runs
+        # share a root
+        parent = np.arange(run_count)
+        while True:
+            upper_roots = parent[upper]
+            lower_roots = parent[lower]
+            joined = upper_roots != lower_roots
+            if not joined.any():
+                break
+            parent[np.maximum(upper_roots, lower_roots)[joined]] = np.minimum(upper_roots, lower_roots)[joined]
+            while True:
+                grand_parent = parent[parent]
+                if np.array_equal(grand_parent, parent):
+                    break
+                parent = grand_parent
+
+        # Regions numbered in the order of their roots
+        roots = parent == np.arange(run_count)
+        self.run_regions = (np.cumsum(roots) - 1)[parent]
+        order = np.argsort(self.run_regions, kind='stable')
+        self.region_runs = np.stack([rows[order], starts[order], ends[order]], axis=1)
+        self.region_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.run_regions))])
+        self.run_keys = rows * width + starts
+
+    def region_at(self, x, y):
+        """Label of the zero region containing the zero cell (x, y)."""
+        run = np.searchsorted(self.run_keys, x * self.field_size[1] + y, side='right') - 1
+        return self.run_regions[run]
+
+    def reveal_region(self, region):
+        """Reveal a zero region and the hint cells around it in one update of the markers. Every cell next to a
+        zero cell is free of mines, so the region with its border is the union of its runs widened by one cell in
+        every direction.
+
+        :param region: label of the region (see region_at)
+        """
+        height, width = self.field_size
+        runs = self.region_runs[self.region_offsets[region]:self.region_offsets[region + 1]]
+        rows = (runs[:, 0][:, np.newaxis] + np.array([-1, 0, 1])).ravel()
+        starts = np.repeat(np.maximum(runs[:, 1] - 1, 0), 3)
+        ends = np.repeat(np.minimum(runs[:, 2] + 1, width), 3)
+        inside = (rows >= 0) & (rows < height)
+        rows, starts, ends = rows[inside], starts[inside], ends[inside]
+
+        lengths = ends - starts
+        cells = (np.repeat(rows * width + starts - np.cumsum(lengths) + lengths, lengths)
+                 + np.arange(lengths.sum()))
+        self.marker_field.reshape(-1)[cells] = 1
 
     def action(self, x, y, flag):
         """Handler for action events on a field position
@@ -95,7 +175,7 @@ class Minefield:
         :param y: Y coordinate
         :return: Whether a mine was hit
         """
-        if self.field[x][y] == 9:
+        if self.field[x][y] == MINE:
             self.reveal_all()
             self.marker_field[x][y] = 99
             return True
@@ -104,27 +184,43 @@ class Minefield:
             return False
 
     def sweep_field(self, x, y):
-        """Recursive function to sweep the field around the given coordinates.
+        """Sweep the field around the given coordinates: a hint cell is revealed alone, a zero cell with its whole
+        region (see reveal_region).
 
         :param x: X coordinate
         :param y: Y coordinate
         """
-        # Bounds check
-        if x not in range(0, self.field_size[0]) or y not in range(0, self.field_size[1]):
-            return
-
         value = self.field[x][y]
-        marker_value = self.marker_field[x][y]
-        if value > 8 or marker_value > 0:
+        if value > 8 or self.marker_field[x][y] > 0:
             return
 
-        self.marker_field[x][y] = 1
+        if value != 0:
+            self.marker_field[x][y] = 1
+        elif self.region_runs is not None:
+            self.reveal_region(self.region_at(x, y))
+        else:
+            self.flood_fill(x, y)
+
+    def flood_fill(self, x, y):
+        """Sweep cell by cell from the given coordinates through all neighbouring zero cells (iterative, for fields
+        whose regions are not labelled).
 
-        if value == 0:
-            for dx in [-1, 0, 1]:
-                for dy in [-1, 0, 1]:
-                    if dx != 0 or dy != 0:
-                        self.sweep_field(x + dx, y + dy)
+        :param x: X coordinate
+        :param y: Y coordinate
+        """
+        height, width = self.field_size
+        stack = [(x, y)]
+        while stack:
+            x, y = stack.pop()
+            if self.field[x][y] > 8 or self.marker_field[x][y] > 0:
+                continue
+
+            self.marker_field[x][y] = 1
+            if self.field[x][y] == 0:
+                for dx in [-1, 0, 1]:
+                    for dy in [-1, 0, 1]:
+                        if (dx != 0 or dy != 0) and 0 <= x + dx < height and 0 <= y + dy < width:
+                            stack.append((x + dx, y + dy))
 
     def check_finish(self):
         """Check if the minefield has been swept completely and all mines are flagged.
@@ -141,3 +237,22 @@ class Minefield:
 
     def reveal_all(self):
         self.marker_field = np.ones_like(self.marker_field)
+
+
+
+def place_randomly(cells, rng, amount:int, value:int):
+    """Set exactly amount cells that do not hold the value yet to the value, uniformly chosen in O(amount) without
+    scanning all cells: random cells are drawn until enough different free ones were hit.
+
+    :param cells: flat numpy array of the cells, changed in place
+    :param rng: numpy random Generator
+    :param amount: Number of cells to set (at most the number of cells not holding the value).
+    :param value: Value to place.
+    """
+    while amount > 0:
+        drawn = np.sort(rng.integers(len(cells), size=amount))
+        # Drop the duplicates (np.unique is much slower for large arrays) and the cells already holding the value
+        drawn = drawn[np.concatenate([[True], drawn[1:] != drawn[:-1]])]
+        drawn = drawn[cells[drawn] != value]
+        cells[drawn] = value
+        amount -= len(drawn)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from minefield import MINE, Minefield
+
+
+def reference_hints(mines):
+    """Hints of the original Minefield.setup_hints: mines as 9, other cells the number of neighbouring mines."""
+    height, width = mines.shape
+    padded = np.pad(mines.astype(int), 1)
+    kernel = np.ones((3, 3), dtype=int)
+    kernel[1][1] = 0
+    field = np.zeros(mines.shape, dtype=int)
+    for ii in range(height):
+        for jj in range(width):
+            field[ii][jj] = 9 if mines[ii][jj] else np.sum(padded[ii:ii + 3, jj:jj + 3] * kernel)
+    return field
+
+
+def reference_sweep(field, marker_field, x, y):
+    """Recursive sweep of the original Minefield.sweep_field."""
+    if not (0 <= x < field.shape[0] and 0 <= y < field.shape[1]):
+        return
+    if field[x][y] > 8 or marker_field[x][y] > 0:
+        return
+
+    marker_field[x][y] = 1
+    if field[x][y] == 0:
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                if dx != 0 or dy != 0:
+                    reference_sweep(field, marker_field, x + dx, y + dy)
+
+
+def random_minefields(count:int):
+    rng = np.random.default_rng(0)
+    for seed in range(count):
+        height, width = map(int, rng.integers(1, 21, 2))
+        yield Minefield((height, width), int(rng.integers(0, 101)), seed=seed)
+
+
+def test_hints_and_mine_count():
+    for minefield in random_minefields(300):
+        mines = minefield.field == MINE
+        assert mines.sum() == minefield.amount_mines
+        assert np.array_equal(minefield.field, reference_hints(mines))
+
+
+def test_same_seed_same_field():
+    assert np.array_equal(Minefield((30, 40), 20, seed=7).field, Minefield((30, 40), 20, seed=7).field)
+
+
+def test_sweep_matches_reference():
+    rng = np.random.default_rng(1)
+    for minefield in random_minefields(300):
+        height, width = minefield.field_size
+        marker_field = minefield.marker_field.astype(int)
+        for _ in range(3):
+            x, y = int(rng.integers(height)), int(rng.integers(width))
+            if minefield.field[x][y] == MINE:
+                continue
+            assert not minefield.sweep(x, y)
+            reference_sweep(minefield.field, marker_field, x, y)
+            assert np.array_equal(minefield.marker_field, marker_field)
+
+
+@pytest.mark.parametrize("percent_mines", [0, 100])
+def test_extreme_mine_percentages(percent_mines):
+    minefield = Minefield((5, 7), percent_mines, seed=0)
+    assert (minefield.field == MINE).sum() == (1 if percent_mines == 0 else 35)
@@ -1,11 +1,57 @@
+import json
+import os
+import time
+
+import numpy as np
+
+import batch_grid
+import bitboard
+import evaluation
+from evaluation import Evaluator
 from game_grid import GameGrid
 from game_ui import GameUI
+from parallel_search import ParallelSearch
+from search_stats import SearchStats
+from transposition import TranspositionTable
+
+# Value of a position in which no move is possible anymore, lowered below the lowest evaluation of the evaluator of the
+# expectimax search if necessary (see game_over_value)
+GAME_OVER_VALUE = -10000
+
+SEARCH_MODES = ['greedy', 'expectimax', 'frontier']
+
+# Maximum number of cells of the fields of one ply of the frontier search (int64, 32 MB). Deeper searches fall back
+# to the greedy search, which needs memory only per ply.
+FRONTIER_MAX_CELLS = 1 << 22
+
+# Depth beyond the depth of the steps up to which Agent.ponder searches the positions after the chosen move
+PONDER_EXTRA_DEPTH = 2
+
+# Scoring of the greedy search (State.update_score), all terms are multiplied by the number of moves of the state:
+# failed_move -> move did not change the board, equal_neighbour -> per pair of equal neighbouring cells,
+# fewer_equal_neighbours -> less equal neighbours than the parent state (tiles were merged), largest_in_corner ->
+# largest tile lies in a corner
+DEFAULT_SCORE_WEIGHTS = {
+    "failed_move": -100,
+    "equal_neighbour": 15,
+    "fewer_equal_neighbours": 100,
+    "largest_in_corner": 25,
+}
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget of a step is spent."""
+
+
+class SearchCancelled(Exception):
+    """Raised by Agent.step when the search has been stopped by setting Agent.stop_requested (from another thread)."""
 
 
 def neighbours_checker(grid):
     equal_neighs = 0
 
     for row in grid:
+        row = list(row)
         for jj in range(len(row)-1):
             if row[jj] == row[jj+1]:
                 equal_neighs += 1
@@ -14,126 +60,615 @@ def neighbours_checker(grid):
 
 
 class State:
-    def __init__(self, grid:GameGrid, state_move:int=None, parent=None):
-        """
-
-        :param grid: GameGrid instance.
-        :param state_move: the move performed to reach this state (from the parent state).
-        :param parent: parent (previous) state before the move has been applied.
+    __slots__ = ['grid', 'board', 'grid_score', 'score', 'root_move', 'move_no', 'equal_neighbours',
+                 'parent_equal_neighbours', 'weights']
+
+    def __init__(self, grid:GameGrid, board=None, grid_score:int=None, root_move:int=None,
+                 parent_equal_neighbours:int=0, weights:dict=None):
+        """Search node. Only holds the (packed) board of the node and its scores, neither the moves
+        performed to reach it nor its parent.
+
+        :param grid: GameGrid instance. Provides the rules (board operations) and is shared by all states of a search.
+        :param board: board of the state. If None is given, the current board of the grid will be used.
+        :param grid_score: game score of the state. If None is given, the current score of the grid will be used.
+        :param root_move: the first move performed from the root state to reach this state.
+        :param parent_equal_neighbours: number of equal neighbours of the parent (previous) state.
+        :param weights: weights of the scoring terms (see DEFAULT_SCORE_WEIGHTS), shared by all states of a search.
         """
-        self.score = 0
-
         self.grid = grid
-        self.parent = parent
-        self.performed_moves = parent.performed_moves.copy() if parent else []
+        self.board = board if board is not None else grid.board
+        self.grid_score = grid_score if grid_score is not None else grid.score
+        self.root_move = root_move
 
+        self.score = 0
         self.move_no = 0
         self.equal_neighbours = 0
-
-        if state_move is not None: self.performed_moves.append(state_move)
+        self.parent_equal_neighbours = parent_equal_neighbours
+        self.weights = weights if weights is not None else DEFAULT_SCORE_WEIGHTS
 
     def move(self, direction):
-        success = self.grid.move(direction)
+        new_board, score = self.grid.board_move(self.board, direction)
+        self.grid_score += score
+
+        success = self.grid.board_changed(self.board, new_board)
+        if success:
+            new_board = self.grid.board_spawn(new_board)
+            success = new_board is not None
+            if success:
+                self.board = new_board
+
         self.move_no += 1
         self.update_score(success)
 
         return success
 
     def update_score(self, move_success:bool):
+        weights = self.weights
         base_score = 0
         if not move_success:
-            base_score -= 100
+            base_score += weights["failed_move"]
 
-        base_score += self.has_equal_neighbour() * 15
-        if self.equal_neighbours < self.parent.equal_neighbours:
-            base_score += 100
+        base_score += self.has_equal_neighbour() * weights["equal_neighbour"]
+        if self.equal_neighbours < self.parent_equal_neighbours:
+            base_score += weights["fewer_equal_neighbours"]
         if self.check_largest_in_corner():
-            base_score += 25
+            base_score += weights["largest_in_corner"]
 
-        self.score = base_score * self.move_no + self.grid.score
+        self.score = base_score * self.move_no + self.grid_score
 
     def has_equal_neighbour(self):
-        equal_neighbours = neighbours_checker(self.grid.field) + neighbours_checker(self.grid.field.T)
+        if self.grid.packed:
+            equal_neighbours = evaluation.equal_neighbours(self.board)
+        else:
+            rows = self.grid.board_rows(self.board)
+            equal_neighbours = neighbours_checker(rows) + neighbours_checker(zip(*rows))
         self.equal_neighbours = equal_neighbours
         return equal_neighbours
 
     def check_largest_in_corner(self):
-        max_pos = None
-        max_val = 0
+        """Whether one of the corners holds a tile of the largest value (the same rule for all frame sizes, see
+        evaluation.largest_in_corner and batch_grid.largest_in_corner)."""
+        if self.grid.packed:
+            return evaluation.largest_in_corner(self.board)
 
-        nn = len(self.grid.field)
-        for ii in range(nn):
-            for jj in range(nn):
-                value = self.grid.field[ii][jj]
-                if value > max_val:
-                    max_val = value
-                    max_pos = (ii, jj)
-
-        return max_pos[0] in [0, nn] and max_pos[1] in [0, nn]
+        rows = self.grid.board_rows(self.board)
+        corners = [rows[0][0], rows[0][-1], rows[-1][0], rows[-1][-1]]
+        return max(corners) == max(max(row) for row in rows)
 
     def copy(self, state_move:int):
-        new_grid = GameGrid(self.grid.frame_size, self.grid.base_number, self.grid.percent_double_base_on_spawn)
-        new_grid.field = self.grid.copy()
-        new_grid.score = self.grid.score
-        return State(new_grid, state_move=state_move, parent=self)
+        root_move = self.root_move if self.root_move is not None else state_move
+        return State(self.grid, self.board, self.grid_score, root_move, parent_equal_neighbours=self.equal_neighbours,
+                     weights=self.weights)
 
 
 class Agent:
-    def __init__(self, grid:GameGrid=None, ui:GameUI=None):
+    def __init__(self, grid:GameGrid=None, ui:GameUI=None, search_mode:str='greedy', prob_cutoff:float=0.0001,
+                 table_size:int=500000, persist_table:bool=False, time_budget:float=0, evaluator=None,
+                 stats_file:str=None, score_weights:dict=None, workers:int=1):
         """AI Agent for the Game 2048.
 
         :param grid: GameGrid instance for the game. Will be ignored when a game ui is supplied.
         :param ui: Game UI instance for the game. Will be preferred over game_grid.
+        :param search_mode: 'greedy' -> best sampled leaf of all move sequences, 'expectimax' -> best expected value
+            over all possible spawns (only for packed 4x4 grids, other grids fall back to 'greedy'), 'frontier' ->
+            the greedy search expanded one ply at a time for all states at once (see frontier_search), falls back to
+            'greedy' for depths whose last ply would exceed FRONTIER_MAX_CELLS.
+        :param prob_cutoff: Expectimax only. Spawn branches reached with a lower cumulative probability are not
+            expanded any further but evaluated directly.
+        :param table_size: Expectimax only. Maximum entries of the transposition table, 0 disables the table.
+        :param persist_table: Expectimax only. Keep the transposition table between consecutive steps (of one game).
+            Use reset() when a new game starts.
+        :param time_budget: Time per step in seconds. If > 0 the search deepens iteratively until the budget is spent
+            and the depth given to step() is only the maximum depth.
+        :param evaluator: Expectimax only. Evaluation of the leaf boards, any object with an evaluate(board) method.
+            Defaults to an Evaluator with the default weights.
+        :param stats_file: If given, the statistics of every step (see stats) are appended as JSON lines to this file.
+        :param score_weights: Greedy and frontier only. Weights of the scoring terms of the states, missing terms use
+            DEFAULT_SCORE_WEIGHTS.
+        :param workers: Expectimax only. Number of processes searching the spawn outcomes of the root moves in parallel
+            (None -> number of CPUs, 1 -> search in this process). The process pool is started with the first parallel
+            search and kept until close().
         """
         if grid is None and ui is None:
             raise ValueError("Either a GameGrid or a GameUI have to be supplied.")
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{search_mode}'.")
 
         self.grid = grid
         self.ui = ui
+        self.search_mode = search_mode
+        self.prob_cutoff = prob_cutoff
+        self.persist_table = persist_table
+        self.table = TranspositionTable(max_entries=table_size) if table_size > 0 else None
+        self.time_budget = time_budget
+        self.evaluator = evaluator if evaluator is not None else Evaluator()
+        self.game_over_value = game_over_value(self.evaluator)
+        self.score_weights = dict(DEFAULT_SCORE_WEIGHTS)
+        if score_weights is not None:
+            self.score_weights.update(score_weights)
+
+        unknown_terms = set(self.score_weights) - set(DEFAULT_SCORE_WEIGHTS)
+        if unknown_terms:
+            raise ValueError(f"Unknown scoring terms: {sorted(unknown_terms)}")
+
+        self.best_state = None
+        # Value of every legal root move of the last step
+        self.root_values = {}
+        self.deadline = None
+        self.depth_reached = 0
+        self.stop_requested = False
+        self.stats = SearchStats(stream_file=stats_file)
+        self.workers = workers
+        self.parallel = None
+        # Results of ponder(): (board, score) of a position -> (depth, results of search_root)
+        self.pondered = {}
+
+        # Spawn rules of the grid that is currently searched (expectimax)
+        self.base_number = 2
+        self.prob_double = 0.1
+
+    @classmethod
+    def from_profile(cls, profile:dict, grid:GameGrid=None, ui:GameUI=None, **kwargs):
+        """Agent configured by a profile (see load_profile), e.g. the result of a tuning run (tuning.py).
+
+        :param kwargs: further arguments of the Agent (e.g. time_budget)
+        """
+        evaluation_weights = profile.get("evaluation_weights")
+        evaluator = Evaluator(evaluation_weights) if evaluation_weights is not None else None
+        kwargs.setdefault("search_mode", profile.get("search_mode", 'greedy'))
+        return cls(grid=grid, ui=ui, evaluator=evaluator, score_weights=profile.get("score_weights"), **kwargs)
+
+    def __enter__(self):
+        return self
 
-        self.states = []
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the process pool of the parallel search."""
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def processes(self):
+        return self.workers or os.cpu_count() or 1
+
+    def reset(self):
+        """Forget everything learned about the previous game (transposition table) and start new game statistics."""
+        if self.table is not None:
+            self.table.clear()
+        self.pondered = {}
+        self.stats.new_game()
 
     def step(self, grid:GameGrid, depth:int):
         """Perform one step of search for the best move
 
         :param grid: GameGrid instance
-        :param depth: depth for search
+        :param depth: depth for search. With a time budget this is the maximum depth of the iterative deepening.
         :return: best state and best move to reach the best state
         """
-        best_state = self.depth_search(state=State(grid), depth=depth)
-
-        if best_state.performed_moves:
-            return best_state, best_state.performed_moves[0]
+        self.prepare_search(grid)
+        self.stats.begin_step()
+        if self.table is not None:
+            hits, misses = self.table.hits, self.table.misses
+
+        # The position may already have been searched (at least as deep) while pondering on the previous move
+        pondered = self.pondered.get((grid.board, grid.score))
+        self.pondered = {}
+        if pondered is not None and pondered[0] >= depth:
+            self.depth_reached, results = pondered
+        elif self.time_budget > 0:
+            pondered = None
+            results = self.iterative_deepening(grid, max_depth=depth)
         else:
-            return best_state, -1
+            pondered = None
+            results = self.search_root(grid, depth)
+            self.depth_reached = depth
+
+        self.root_values = {move: value for move, (value, _) in results.items()}
+        if self.table is not None:
+            self.stats.cache_hits += self.table.hits - hits
+            self.stats.cache_misses += self.table.misses - misses
+
+        if not results:
+            self.stats.end_step(-1, self.depth_reached, self.search_mode, pondered is not None)
+            return State(grid), -1
+
+        # Best root move, the first one in search order on ties
+        best_move = max(results, key=lambda move: results[move][0])
+        self.stats.end_step(best_move, self.depth_reached, self.search_mode, pondered is not None)
+        return results[best_move][1], best_move
+
+    def ponder(self, grid:GameGrid, move:int, depth:int, extra_depth:int=PONDER_EXTRA_DEPTH):
+        """Search the positions that can follow a move in advance, while waiting for the move to be performed. The
+        positions are searched in the order of their probability, first all of them with the depth of the steps, then
+        deeper (up to depth + extra_depth). A following step() on one of these positions uses the deepest completed
+        result instead of searching again.
+
+        Runs until all positions are searched, stop it by setting stop_requested (raises SearchCancelled).
+
+        :param grid: GameGrid instance of the current position (the one step() searched)
+        :param move: chosen move, not yet performed on the grid
+        :param depth: depth of the steps
+        """
+        new_board, score = grid.move_result(move)
+        if not grid.board_changed(grid.board, new_board):
+            return
 
-    def depth_search(self, state:State, depth):
-        """Perform search for best move in a set number of steps ahead.
+        self.prepare_search(grid)
+        self.pondered = {}
+        children = []
+        for _, board in grid.spawn_outcomes(new_board):
+            child = grid.clone()
+            child.set_board(board)
+            child.score = grid.score + score
+            children.append(child)
+
+        for ponder_depth in range(depth, depth + extra_depth + 1):
+            for child in children:
+                results = self.search_root(child, ponder_depth)
+                self.pondered[(child.board, child.score)] = (ponder_depth, results)
+
+    def prepare_search(self, grid:GameGrid):
+        """Adopt the spawn rules of the grid and reset the transposition table when necessary."""
+        prob_double = grid.percent_double_base_on_spawn / 100
+        if not self.persist_table or (self.base_number, self.prob_double) != (grid.base_number, prob_double):
+            # Stored values are only valid for the same spawn rules
+            if self.table is not None:
+                self.table.clear()
+
+        self.base_number = grid.base_number
+        self.prob_double = prob_double
+        # The evaluator may have been replaced since the last search
+        self.game_over_value = game_over_value(self.evaluator)
+
+    def iterative_deepening(self, grid:GameGrid, max_depth:int):
+        """Search with increasing depth until the time budget is spent. Every iteration searches the root moves in
+        the order of their values in the previous iteration.
 
-        :param state: current state of the game
-        :param depth: depth for search
-        :return: best state in *depth* moves
+        :param grid: GameGrid instance
+        :param max_depth: maximum depth for search
+        :return: results of the deepest completed iteration (see search_root)
         """
-        self.states = []
+        deadline = time.perf_counter() + self.time_budget
+        order = list(range(4))
+        results = {}
+        self.depth_reached = 0
+
+        for depth in range(1, max_depth + 1):
+            partial_results = {}
+            # The first iteration always completes, so there is a move even for very small budgets
+            self.deadline = deadline if depth > 1 else None
+            try:
+                self.search_root(grid, depth, order, partial_results)
+            except SearchTimeout:
+                # The partial iteration is still usable if it completed the best move of the previous iteration:
+                # all moves it has not searched were worse before.
+                if order[0] in partial_results:
+                    results = partial_results
+                break
+            finally:
+                self.deadline = None
+
+            results = partial_results
+            self.depth_reached = depth
+            order = sorted(results, key=lambda move: results[move][0], reverse=True)
+
+            if len(results) <= 1:
+                # Forced move (or game over), a deeper search will not change the decision
+                break
+
+        return results
+
+    def search_root(self, grid:GameGrid, depth:int, order=range(4), results:dict=None):
+        """Search all legal root moves.
 
-        self.lookup(state=state, depth=depth)
+        :param grid: GameGrid instance
+        :param depth: depth for search
+        :param order: order in which the root moves are searched
+        :param results: dict to fill with the results, filled in while searching (so it is available even if the
+            search is interrupted)
+        :return: dict mapping every legal root move to its value and the state representing it (the best leaf for
+            the greedy search, the root with the expected value as score for expectimax)
+        """
+        if results is None:
+            results = {}
+
+        # The moves of the root are already known to the grid
+        legal_moves = grid.legal_moves_mask
+        if self.search_mode == 'frontier' and self.frontier_fits(grid, depth):
+            values = self.frontier_search(grid, depth)
+            for direction in order:
+                if direction in values:
+                    state = State(grid, root_move=direction)
+                    state.score = values[direction]
+                    results[direction] = (values[direction], state)
+        elif self.search_mode == 'expectimax' and grid.packed:
+            move_results = grid.move_results()
+            moves = [direction for direction in order if legal_moves >> direction & 1]
+            parallel_values = None
+            if depth > 1 and self.processes() > 1:
+                parallel_values = self.parallel_chance_values([move_results[direction][0] for direction in moves],
+                                                              depth-1)
+
+            for index, direction in enumerate(moves):
+                new_board, score = move_results[direction]
+                if parallel_values is None:
+                    chance_value = self.chance_node(new_board, depth-1, 1.0)
+                elif parallel_values[index] is None:
+                    # Timed out
+                    continue
+                else:
+                    chance_value = parallel_values[index]
+                value = score + chance_value
+
+                state = State(grid, root_move=direction)
+                state.score = value
+                results[direction] = (value, state)
+
+            if parallel_values is not None and None in parallel_values:
+                raise SearchTimeout()
+        else:
+            root = State(grid, weights=self.score_weights)
+            for direction in order:
+                if not legal_moves >> direction & 1:
+                    continue
 
-        if not self.states:
-            return state
+                new_state = root.copy(state_move=direction)
+                if not new_state.move(direction=direction):
+                    continue
 
-        # Identify the best state based on the score
-        best_state = max(self.states, key=lambda s: s.score)
+                self.best_state = None
+                self.lookup(new_state, depth-1)
+                if self.best_state is not None:
+                    results[direction] = (self.best_state.score, self.best_state)
 
-        return best_state
+        return results
 
     def lookup(self, state:State, depth:int):
+        if self.stop_requested:
+            raise SearchCancelled()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
         if depth == 0:
-            self.states.append(state)
+            self.stats.leaves += 1
+            # Keep only the best leaf based on the score (the first one found on ties)
+            if self.best_state is None or state.score > self.best_state.score:
+                self.best_state = state
             return
 
+        self.stats.nodes += 1
         for ii in range(4):
             new_state = state.copy(state_move=ii)
             success = new_state.move(direction=ii)
 
             if success:
                 self.lookup(new_state, depth-1)
+            else:
+                self.stats.pruned += 1
+
+    @staticmethod
+    def frontier_fits(grid:GameGrid, depth:int):
+        """Whether all 4**depth states of the last ply of a frontier search stay within FRONTIER_MAX_CELLS."""
+        return 4 ** depth * grid.frame_size ** 2 <= FRONTIER_MAX_CELLS
+
+    def frontier_search(self, grid:GameGrid, depth:int):
+        """Greedy search expanded level by level: all states of a ply are held as one (K, size, size) array of
+        fields, so moves, spawns and scoring are numpy operations over the whole frontier instead of one State at a
+        time. The states are scored like State.update_score. Spawns are drawn from the generator of the grid.
+
+        The frontier grows by up to 4 states per ply (4**depth leaves), so this pays off for wide, shallow searches.
+        search_root only uses it while frontier_fits(), deeper searches run the greedy search.
+
+        :param grid: GameGrid instance
+        :param depth: depth for search
+        :return: dict mapping every legal root move to the score of its best leaf
+        """
+        weights = self.score_weights
+        fields = grid.field[np.newaxis].astype(np.int64)
+        grid_scores = np.array([grid.score], dtype=np.int64)
+        root_moves = np.zeros(1, dtype=np.int64)
+        # The root is not scored, so its children never have less equal neighbours than their parent
+        parent_equal_neighbours = np.zeros(1, dtype=np.int64)
+        scores = np.zeros(0)
+
+        for ply in range(1, depth + 1):
+            if self.stop_requested:
+                raise SearchCancelled()
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+
+            # All 4 moves of every state, the states whose move failed are dropped
+            moved = [batch_grid.stack_fields(fields, direction) for direction in range(4)]
+            new_fields = np.stack([new_field for new_field, _ in moved])
+            gained = np.stack([score for _, score in moved])
+            changed = (new_fields != fields).any(axis=(2, 3))
+            self.stats.nodes += len(fields)
+            self.stats.pruned += int(changed.size - changed.sum())
+
+            directions, parents = np.nonzero(changed)
+            if len(parents) == 0:
+                return {}
+            fields = new_fields[directions, parents]
+            grid_scores = grid_scores[parents] + gained[directions, parents]
+            root_moves = directions if ply == 1 else root_moves[parents]
+            batch_grid.spawn_fields(fields, grid.rng, grid.base_number, grid.percent_double_base_on_spawn)
+
+            equal_neighbours = batch_grid.equal_neighbours(fields)
+            base_scores = (equal_neighbours * weights["equal_neighbour"]
+                           + (equal_neighbours < parent_equal_neighbours[parents]) * weights["fewer_equal_neighbours"]
+                           + batch_grid.largest_in_corner(fields) * weights["largest_in_corner"])
+            # Like State.copy, every state counts as the first move of its own (move_no 1)
+            scores = base_scores + grid_scores
+            parent_equal_neighbours = equal_neighbours
+
+        self.stats.leaves += len(scores)
+        # Best leaf per root move
+        values = np.full(4, -np.inf)
+        np.maximum.at(values, root_moves, scores)
+        return {direction: float(values[direction]) for direction in range(4) if values[direction] > -np.inf}
+
+    def parallel_chance_values(self, boards, depth:int):
+        """Values of chance_node(board, depth, 1.0) of the boards after the root moves, with the max nodes of all
+        their spawn outcomes searched on the process pool. The values are combined in the same order as in
+        chance_node, so they equal those of the serial search (except for the prob_cutoff effect on reused
+        transposition table values, as the workers do not share their tables).
+
+        :param boards: packed boards after the root moves
+        :return: list of the values, None for boards whose search has timed out
+        :raises SearchCancelled: If stop_requested is set while waiting for the workers.
+        """
+        if self.parallel is None:
+            config = {"prob_cutoff": self.prob_cutoff, "evaluator": self.evaluator,
+                      "table_size": self.table.max_entries if self.table is not None else 0}
+            self.parallel = ParallelSearch(self.processes(), config)
+        deadline = None if self.deadline is None else time.time() + self.deadline - time.perf_counter()
+
+        values = [None] * len(boards)
+        # Board index -> empty cells and spawn codes with their probabilities
+        spawns = {}
+        tasks = []
+        for index, board in enumerate(boards):
+            if self.table is not None:
+                stored_value = self.table.get(self.table.key(board, depth))
+                if stored_value is not None:
+                    values[index] = stored_value
+                    continue
+
+            self.stats.nodes += 1
+            empty_cells = bitboard.empty_cells(board)
+            cell_prob = 1.0 / len(empty_cells)
+            codes = [(code, code_prob) for code, code_prob in [(1, 1 - self.prob_double), (2, self.prob_double)]
+                     if code_prob != 0]
+            spawns[index] = (len(empty_cells), codes)
+            for code, code_prob in codes:
+                for cell_no, cell in enumerate(empty_cells):
+                    tasks.append(((index, code, cell_no), bitboard.set_cell(board, cell, code), depth,
+                                  cell_prob * code_prob, self.base_number, self.prob_double, self.persist_table,
+                                  deadline))
+
+        if not tasks:
+            return values
+        completed = self.parallel.run(tasks, is_cancelled=lambda: self.stop_requested)
+        if completed is None:
+            raise SearchCancelled()
+
+        child_values = {}
+        for key, value, counters in completed:
+            child_values[key] = value
+            if counters is not None:
+                self.stats.nodes += counters[0]
+                self.stats.leaves += counters[1]
+                self.stats.pruned += counters[2]
+                self.stats.cache_hits += counters[3]
+                self.stats.cache_misses += counters[4]
+
+        for index, (cell_count, codes) in spawns.items():
+            if any(child_values[(index, code, cell_no)] is None for code, _ in codes for cell_no in range(cell_count)):
+                continue
+
+            expected_value = 0
+            for code, code_prob in codes:
+                value_sum = 0
+                for cell_no in range(cell_count):
+                    value_sum += child_values[(index, code, cell_no)]
+                expected_value += code_prob * value_sum
+
+            expected_value /= cell_count
+            if self.table is not None:
+                self.table.put(self.table.key(boards[index], depth), expected_value)
+            values[index] = expected_value
+
+        return values
+
+    def max_node(self, board, depth:int, prob:float):
+        """Player decision: best move and its value (merge score plus expected value of the following spawn)."""
+        self.stats.nodes += 1
+        best_move = -1
+        best_value = self.game_over_value
+
+        for direction in range(4):
+            new_board, score = bitboard.move(board, direction)
+            if new_board == board:
+                continue
+
+            value = score * self.base_number + self.chance_node(new_board, depth-1, prob)
+            if best_move < 0 or value > best_value:
+                best_move = direction
+                best_value = value
+
+        return best_move, best_value
+
+    def chance_node(self, board, depth:int, prob:float):
+        """Random spawn: expected value over all empty cells and both spawn values.
+
+        :param board: packed board after a move
+        :param depth: remaining moves to look ahead
+        :param prob: cumulative probability of reaching this node
+        """
+        # Values in the transposition table are keyed by board and depth only. A value stored for a more likely
+        # occurrence of the board is reused for less likely ones (and vice versa), regardless of the prob_cutoff.
+        if depth <= 0 or prob < self.prob_cutoff:
+            if depth > 0:
+                self.stats.pruned += 1
+            return self.evaluate_board(board)
+
+        if self.stop_requested:
+            raise SearchCancelled()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        if self.table is not None:
+            key = self.table.key(board, depth)
+            stored_value = self.table.get(key)
+            if stored_value is not None:
+                return stored_value
+
+        self.stats.nodes += 1
+        empty_cells = bitboard.empty_cells(board)
+        cell_prob = prob / len(empty_cells)
+
+        expected_value = 0
+        for code, code_prob in [(1, 1 - self.prob_double), (2, self.prob_double)]:
+            if code_prob == 0:
+                continue
+
+            value_sum = 0
+            for index in empty_cells:
+                _, value = self.max_node(bitboard.set_cell(board, index, code), depth, cell_prob * code_prob)
+                value_sum += value
+            expected_value += code_prob * value_sum
+
+        expected_value /= len(empty_cells)
+        if self.table is not None:
+            self.table.put(key, expected_value)
+
+        return expected_value
+
+    def evaluate_board(self, board):
+        """Static evaluation of a leaf board."""
+        self.stats.leaves += 1
+        return self.evaluator.evaluate(board)
+
+
+def game_over_value(evaluator):
+    """Value of a lost position for the expectimax search: GAME_OVER_VALUE or, if the evaluator can rate a board as
+    low as that (see min_value of Evaluator and NTupleNetwork), below the lowest value of the evaluator. Otherwise a
+    lost position could be preferred to a live one."""
+    min_value = getattr(evaluator, "min_value", None)
+    if min_value is None:
+        return GAME_OVER_VALUE
+    return min(GAME_OVER_VALUE, min_value() - 1)
+
+
+def load_profile(path:str):
+    """Read an agent profile: JSON object with search_mode, depth, score_weights (greedy search) and
+    evaluation_weights (expectimax search), all optional. See Agent.from_profile."""
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_profile(path:str, profile:dict):
+    with open(path, "w") as file:
+        json.dump(profile, file, indent=2)
@@ -0,0 +1,212 @@
+import numpy as np
+
+
+class BatchGameGrid:
+    def __init__(self, batch_size:int, frame_size:int=4, base_number:int=2, percent_double_base_on_spawn=10,
+                 seed=None):
+        """Several 2048 games played simultaneously. Counterpart of GameGrid for N boards stored as one numpy array
+        of shape (N, frame_size, frame_size). All operations are vectorized over the boards.
+
+        :param batch_size: Number of boards (N).
+        :param frame_size: Size of the game frames.
+        :param base_number: Base number for the games.
+        :param percent_double_base_on_spawn: Probability for 2*base_number to spawn in the game fields.
+        :param seed: Seed for the random number generator of the batch.
+        """
+        self.batch_size = batch_size
+        self.frame_size = frame_size
+        self.base_number = base_number
+        self.percent_double_base_on_spawn = percent_double_base_on_spawn
+
+        self.rng = np.random.default_rng(seed)
+
+        self.field = None
+        self.score = None
+
+        self.restart()
+
+    @classmethod
+    def from_field(cls, field, base_number:int=2, percent_double_base_on_spawn=10, seed=None):
+        """Create a batch from existing fields of shape (N, size, size). The score of all boards starts at 0."""
+        field = np.asarray(field)
+        batch = cls(len(field), field.shape[1], base_number, percent_double_base_on_spawn, seed=seed)
+        batch.field = field.astype(np.int64)
+        return batch
+
+    def restart(self, spawn_no:int=2):
+        self.field = np.zeros((self.batch_size, self.frame_size, self.frame_size), dtype=np.int64)
+        self.score = np.zeros(self.batch_size, dtype=np.int64)
+        self.spawn(spawn_no)
+
+    def spawn(self, spawn_no:int=1, mask=None):
+        """Spawn tiles on all (or the selected) boards at once.
+
+        :param spawn_no: Number of tiles per board.
+        :param mask: Boolean array of shape (N,) selecting the boards to spawn on. None -> all boards.
+        :return: Boolean array of shape (N,), whether all tiles could be placed on a board
+        """
+        if mask is None:
+            mask = np.ones(self.batch_size, dtype=bool)
+
+        success = mask.copy()
+        indices = np.flatnonzero(mask)
+
+        for ii in range(spawn_no):
+            has_space = spawn_fields(self.field, self.rng, self.base_number, self.percent_double_base_on_spawn,
+                                     indices)
+            success[indices[~has_space]] = False
+
+        return success
+
+    def stack(self, directions):
+        """Stack the numbers on all boards without changing the batch.
+
+        :param directions: A single direction for all boards or an array of shape (N,) with a direction per board.
+            Directions are encoded as: 0 -> UP, 1 -> Down, 2 -> Left, 3 -> Right
+        :return: new fields of shape (N, size, size), score gained per board
+        """
+        directions = np.broadcast_to(np.asarray(directions), (self.batch_size,))
+        new_field = np.empty_like(self.field)
+        gained = np.zeros(self.batch_size, dtype=np.int64)
+
+        for direction in range(4):
+            selection = np.flatnonzero(directions == direction)
+            if selection.size == 0:
+                continue
+
+            new_field[selection], gained[selection] = stack_fields(self.field[selection], direction)
+
+        return new_field, gained
+
+    def move(self, directions):
+        """Perform a move on all boards and spawn a new tile on every board that changed.
+
+        :param directions: A single direction for all boards or an array of shape (N,) with a direction per board.
+        :return: changed mask, score gained per board and game over mask (all of shape (N,))
+        """
+        new_field, gained = self.stack(directions)
+        changed = (new_field != self.field).any(axis=(1, 2))
+
+        self.field[changed] = new_field[changed]
+        self.score += gained
+        self.spawn(spawn_no=1, mask=changed)
+
+        return changed, gained, self.check_game_over()
+
+    def legal_moves(self):
+        """Boolean array of shape (N, 4), whether a direction changes the board."""
+        legal = np.zeros((self.batch_size, 4), dtype=bool)
+        for direction in range(4):
+            new_field, _ = stack_fields(self.field, direction)
+            legal[:, direction] = (new_field != self.field).any(axis=(1, 2))
+        return legal
+
+    def check_game_over(self):
+        """Boolean array of shape (N,), whether no move is possible on a board anymore."""
+        field = self.field
+        has_empty = (field == 0).any(axis=(1, 2))
+        horizontal_pair = (field[:, :, :-1] == field[:, :, 1:]).any(axis=(1, 2))
+        vertical_pair = (field[:, :-1, :] == field[:, 1:, :]).any(axis=(1, 2))
+        return ~(has_empty | horizontal_pair | vertical_pair)
+
+    def copy(self):
+        return self.field.copy()
+
+
+def spawn_fields(field, rng, base_number:int=2, percent_double_base_on_spawn=10, indices=None):
+    """Spawn one tile at a random empty position of several fields (in place).
+
+    :param field: numpy array of shape (N, size, size)
+    :param rng: numpy random Generator
+    :param indices: indices of the fields to spawn on. None -> all fields.
+    :return: Boolean array (one entry per selected field), whether the field had an empty cell
+    """
+    flat = field.reshape(len(field), -1)
+    if indices is None:
+        indices = np.arange(len(field))
+
+    empty = flat[indices] == 0
+    has_space = empty.any(axis=1)
+
+    # Uniform choice of an empty cell: the empty cell with the largest random key
+    keys = rng.random(empty.shape)
+    keys[~empty] = -1
+    cells = np.argmax(keys, axis=1)
+
+    double = rng.random(len(indices)) < percent_double_base_on_spawn / 100
+    values = np.where(double, base_number * 2, base_number)
+
+    flat[indices[has_space], cells[has_space]] = values[has_space]
+    return has_space
+
+
+def equal_neighbours(field):
+    """Number of equal (also empty) horizontally or vertically neighbouring cells per field."""
+    return ((field[:, :, :-1] == field[:, :, 1:]).sum(axis=(1, 2))
+            + (field[:, :-1, :] == field[:, 1:, :]).sum(axis=(1, 2)))
+
+
+def largest_in_corner(field):
+    """Boolean array per field, whether its largest tile lies in one of its corners."""
+    corners = field[:, [0, 0, -1, -1], [0, -1, 0, -1]]
+    return corners.max(axis=1) == field.max(axis=(1, 2))
+
+
+def _to_left(field, direction:int):
+    """View of the fields, oriented such that the move direction is LEFT."""
+    if direction in [0, 1]:
+        field = field.transpose(0, 2, 1)
+    if direction in [1, 3]:
+        field = field[:, :, ::-1]
+    return field
+
+
+def _from_left(field, direction:int):
+    """Inverse of _to_left."""
+    if direction in [1, 3]:
+        field = field[:, :, ::-1]
+    if direction in [0, 1]:
+        field = field.transpose(0, 2, 1)
+    return field
+
+
+def stack_rows_left(rows):
+    """Stack rows to the left, vectorized over all rows.
+
+    :param rows: numpy array of shape (M, size)
+    :return: stacked rows (new array) and score gained per row
+    """
+    # Move all non-zeros to the front (stable, so their order is kept)
+    order = np.argsort(rows == 0, axis=1, kind='stable')
+    rows = np.take_along_axis(rows, order, axis=1)
+    score = np.zeros(len(rows), dtype=np.int64)
+
+    for jj in range(rows.shape[1] - 1):
+        merge = (rows[:, jj] != 0) & (rows[:, jj] == rows[:, jj+1])
+        if not merge.any():
+            continue
+
+        merged = np.flatnonzero(merge)
+        rows[merged, jj] *= 2
+        score[merged] += rows[merged, jj]
+        # Close the gap left by the merged tile
+        rows[merged, jj+1:-1] = rows[merged, jj+2:]
+        rows[merged, -1] = 0
+
+    return rows, score
+
+
+def stack_fields(field, direction:int):
+    """Stack the numbers of several fields in one direction.
+
+    :param field: numpy array of shape (N, size, size)
+    :param direction: Directions are encoded as: 0 -> UP, 1 -> Down, 2 -> Left, 3 -> Right
+    :return: new fields of shape (N, size, size), score gained per field
+    """
+    batch_size, size, _ = field.shape
+    rows = _to_left(field, direction).reshape(batch_size * size, size)
+
+    rows, score = stack_rows_left(rows)
+
+    new_field = _from_left(rows.reshape(batch_size, size, size), direction)
+    return np.ascontiguousarray(new_field), score.reshape(batch_size, size).sum(axis=1)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from agent import Agent, State
+from game_grid import GameGrid
+
+
+def make_corpus(frame_size:int, count:int, seed:int):
+    """Fixed set of game positions for a frame size: boards sampled from random games.
+
+    :return: list of (board, score)
+    """
+    grid = GameGrid(frame_size=frame_size, seed=seed)
+    positions = []
+
+    while len(positions) < count:
+        if grid.check_game_over():
+            grid.restart()
+        grid.move(int(grid.random() * 4))
+        # Skip the very early positions of a game now and then, so the corpus contains fuller boards
+        if grid.random() < 0.25:
+            positions.append((grid.board, grid.score))
+
+    return positions
+
+
+def parse_range(text:str):
+    """'1-7' -> [1, ..., 7], '4,6,8' -> [4, 6, 8]"""
+    values = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            values += list(range(int(first), int(last) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+
+class Benchmark:
+    def __init__(self, seed:int=0, corpus_size:int=200, max_time:float=1.0, max_calls:int=100000,
+                 memory_calls:int=20):
+        """Benchmark of the core operations of the game and the agent on fixed-seed board corpora.
+
+        :param seed: Seed for the corpora and the random spawns during the benchmark.
+        :param corpus_size: Number of boards per frame size.
+        :param max_time: Time per benchmark case in seconds (at least one call is always measured).
+        :param max_calls: Maximum calls per benchmark case.
+        :param memory_calls: Calls measured with tracemalloc for the peak memory (separately from the timing).
+        """
+        self.seed = seed
+        self.corpus_size = corpus_size
+        self.max_time = max_time
+        self.max_calls = max_calls
+        self.memory_calls = memory_calls
+
+        self.corpora = {}
+        self.results = {}
+
+    def corpus(self, frame_size:int):
+        if frame_size not in self.corpora:
+            self.corpora[frame_size] = make_corpus(frame_size, self.corpus_size, self.seed)
+        return self.corpora[frame_size]
+
+    def measure(self, name:str, grid:GameGrid, setup, call):
+        """Measure a case. For every call setup(index) prepares the arguments (not timed) and call(arguments) is timed.
+
+        :param grid: GameGrid used by the case, seeded before every pass
+        :return: result dict of the case
+        """
+        # Timing
+        grid.seed(self.seed)
+        latencies = []
+        start = time.perf_counter()
+        while len(latencies) < self.max_calls and (not latencies or time.perf_counter() - start < self.max_time):
+            arguments = setup(len(latencies))
+            call_start = time.perf_counter()
+            call(arguments)
+            latencies.append(time.perf_counter() - call_start)
+
+        # Peak memory
+        grid.seed(self.seed)
+        tracemalloc.start()
+        for index in range(min(self.memory_calls, len(latencies))):
+            arguments = setup(index)
+            tracemalloc.reset_peak()
+            call(arguments)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = np.array(latencies) * 1e6
+        result = {
+            "calls": len(latencies),
+            "ops_per_sec": float(len(latencies) / (latencies.sum() / 1e6)) if latencies.sum() > 0 else 0.0,
+            "mean_us": float(latencies.mean()),
+            "p50_us": float(np.percentile(latencies, 50)),
+            "p90_us": float(np.percentile(latencies, 90)),
+            "p99_us": float(np.percentile(latencies, 99)),
+            "max_us": float(latencies.max()),
+            "peak_memory_bytes": int(peak_memory),
+        }
+        self.results[name] = result
+        print(f"{name:<50} {result['ops_per_sec']:>14.1f} ops/s   p50 {result['p50_us']:>12.1f} us   "
+              f"p99 {result['p99_us']:>12.1f} us   peak {result['peak_memory_bytes']:>10} B")
+        return result
+
+    def run_grid(self, frame_size:int):
+        """GameGrid.stack, move, spawn and check_game_over on the corpus of a frame size."""
+        corpus = self.corpus(frame_size)
+        grid = GameGrid(frame_size=frame_size)
+
+        def setup(index):
+            board, score = corpus[index % len(corpus)]
+            grid.set_board(board)
+            grid.score = score
+            return index % 4
+
+        self.measure(f"grid.stack/size={frame_size}", grid, setup, lambda direction: grid.stack(direction))
+        self.measure(f"grid.move/size={frame_size}", grid, setup, lambda direction: grid.move(direction))
+        self.measure(f"grid.spawn/size={frame_size}", grid, setup, lambda direction: grid.spawn(spawn_no=1))
+        self.measure(f"grid.check_game_over/size={frame_size}", grid, setup, lambda direction: grid.check_game_over())
+
+    def run_state(self, frame_size:int):
+        """State.copy and State.update_score on the corpus of a frame size."""
+        corpus = self.corpus(frame_size)
+        grid = GameGrid(frame_size=frame_size)
+
+        def setup_root(index):
+            board, score = corpus[index % len(corpus)]
+            return State(grid, board=board, grid_score=score), index % 4
+
+        def setup_child(index):
+            root, direction = setup_root(index)
+            return root.copy(state_move=direction)
+
+        self.measure(f"state.copy/size={frame_size}", grid, setup_root, lambda arguments: arguments[0].copy(arguments[1]))
+        self.measure(f"state.update_score/size={frame_size}", grid, setup_child, lambda state: state.update_score(True))
+
+    def run_agent(self, frame_size:int, depth:int, search_mode:str, workers:int=1):
+        """Agent.step on the corpus of a frame size.
+
+        :param workers: processes of the parallel expectimax search (see Agent)
+        """
+        corpus = self.corpus(frame_size)
+        grid = GameGrid(frame_size=frame_size)
+        agent = Agent(grid=grid, search_mode=search_mode, workers=workers)
+        suffix = f"/workers={workers}" if workers != 1 else ""
+
+        def setup(index):
+            board, score = corpus[index % len(corpus)]
+            grid.set_board(board)
+            grid.score = score
+
+        self.measure(f"agent.step/mode={search_mode}/depth={depth}/size={frame_size}{suffix}", grid, setup,
+                     lambda _: agent.step(grid=grid, depth=depth))
+        agent.close()
+
+    def report(self):
+        return {
+            "meta": {
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "seed": self.seed,
+                "corpus_size": self.corpus_size,
+                "max_time": self.max_time,
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+            "results": self.results,
+        }
+
+
+def compare(baseline:dict, current:dict, threshold:float=0.1):
+    """Compare two benchmark reports.
+
+    :param threshold: Relative slowdown (of ops/sec and p50 latency) above which a case counts as regression.
+    :return: list of regressions (case name, baseline ops/sec, current ops/sec, relative change)
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]
+
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1 if old["ops_per_sec"] else 0.0
+        latency_change = result["p50_us"] / old["p50_us"] - 1 if old["p50_us"] else 0.0
+        flag = change < -threshold and latency_change > threshold
+        print(f"{'REGRESSION' if flag else 'ok':<11}{name:<50} {old['ops_per_sec']:>14.1f} -> "
+              f"{result['ops_per_sec']:>14.1f} ops/s ({change:+.1%})")
+        if flag:
+            regressions.append((name, old["ops_per_sec"], result["ops_per_sec"], change))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the 2048 game engine and agent search.")
+    parser.add_argument("--frame-sizes", default="4-8", help="Frame sizes, e.g. '4-8' or '4,6'.")
+    parser.add_argument("--depths", default="1-7", help="Search depths for Agent.step, e.g. '1-7'.")
+    parser.add_argument("--modes", default="greedy,expectimax", help="Search modes for Agent.step.")
+    parser.add_argument("--agent-sizes", default="4-8", help="Frame sizes for the Agent.step cases.")
+    parser.add_argument("--workers", default="1", help="Processes of the expectimax search, e.g. '1,4,16'.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the board corpora and spawns.")
+    parser.add_argument("--corpus-size", type=int, default=200, help="Boards per frame size.")
+    parser.add_argument("--max-time", type=float, default=1.0, help="Time per case in seconds.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="Baseline JSON file, regressions against it make the exit code 1.")
+    parser.add_argument("--current", help="With --compare: compare this result file instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown counted as regression.")
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as file:
+            report = json.load(file)
+    else:
+        benchmark = Benchmark(seed=args.seed, corpus_size=args.corpus_size, max_time=args.max_time)
+        for frame_size in parse_range(args.frame_sizes):
+            benchmark.run_grid(frame_size)
+            benchmark.run_state(frame_size)
+        for frame_size in parse_range(args.agent_sizes):
+            for search_mode in args.modes.split(","):
+                for depth in parse_range(args.depths):
+                    for workers in parse_range(args.workers):
+                        benchmark.run_agent(frame_size, depth, search_mode, workers)
+
+        report = benchmark.report()
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, report, threshold=args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) found.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import numpy as np
+
+# A 4x4 board packed into a single 64-bit integer. Every cell occupies 4 bits (a nibble) holding the tile code:
+# 0 -> empty cell, c > 0 -> tile with the value base_number * 2**(c-1). Cell (x, y) is stored in nibble 4*x + y, so
+# every row of the board is a 16-bit key with its first (left most) cell in the lowest nibble.
+SIZE = 4
+CELL_BITS = 4
+MAX_CODE = (1 << CELL_BITS) - 1
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+
+# Row lookup tables, filled in by _build_tables()
+ROW_LEFT = []
+ROW_RIGHT = []
+COL_UP = []
+COL_DOWN = []
+ROW_SCORE = []
+ROW_REVERSE = []
+
+
+def slide_row(cells, max_code:int=MAX_CODE):
+    """Slide and merge a single row towards its first cell.
+
+    :param cells: list of tile codes
+    :param max_code: highest tile code that fits into a cell
+    :return: new list of tile codes and the score (in multiples of the base number) gained by merging
+    """
+    non_zeros = [c for c in cells if c != 0]
+    new_row = []
+    score = 0
+
+    skip = False
+    for ii, code in enumerate(non_zeros):
+        if skip:
+            skip = False
+            continue
+
+        # Stacking logic. Two tiles of the highest code can not be merged since the result would not fit into a cell.
+        if ii < len(non_zeros)-1 and code == non_zeros[ii+1] and code < max_code:
+            new_row.append(code + 1)
+            score += 1 << code
+            skip = True
+        else:
+            new_row.append(code)
+
+    new_row += [0] * (len(cells) - len(new_row))
+    return new_row, score
+
+
+def _row_to_key(cells):
+    key = 0
+    for ii, code in enumerate(cells):
+        key |= code << (CELL_BITS * ii)
+    return key
+
+
+def _row_to_column(row_key):
+    """Spread a 16-bit row key into the column layout, i.e. nibble ii is moved to nibble 4*ii."""
+    column = 0
+    for ii in range(SIZE):
+        column |= ((row_key >> (CELL_BITS * ii)) & MAX_CODE) << (CELL_BITS * SIZE * ii)
+    return column
+
+
+def _build_tables():
+    for key in range(ROW_MASK + 1):
+        cells = [(key >> (CELL_BITS * ii)) & MAX_CODE for ii in range(SIZE)]
+
+        left, score = slide_row(cells)
+        right, _ = slide_row(cells[::-1])
+
+        left_key = _row_to_key(left)
+        right_key = _row_to_key(right[::-1])
+
+        ROW_LEFT.append(left_key)
+        ROW_RIGHT.append(right_key)
+        COL_UP.append(_row_to_column(left_key))
+        COL_DOWN.append(_row_to_column(right_key))
+        # Merges only happen within runs of equal tiles, so the score is the same in both directions
+        ROW_SCORE.append(score)
+        ROW_REVERSE.append(_row_to_key(cells[::-1]))
+
+
+_build_tables()
+
+
+def transpose(board):
+    """Transpose a packed board (swap rows and columns)."""
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def flip_horizontal(board):
+    """Mirror a packed board left to right (reverse every row)."""
+    return (ROW_REVERSE[board & ROW_MASK] | (ROW_REVERSE[(board >> 16) & ROW_MASK] << 16)
+            | (ROW_REVERSE[(board >> 32) & ROW_MASK] << 32) | (ROW_REVERSE[board >> 48] << 48))
+
+
+def flip_vertical(board):
+    """Mirror a packed board top to bottom (reverse the order of the rows)."""
+    return (((board & ROW_MASK) << 48) | (((board >> 16) & ROW_MASK) << 32)
+            | (((board >> 32) & ROW_MASK) << 16) | (board >> 48))
+
+
+def symmetries(board):
+    """All 8 symmetric variants (rotations and reflections) of a packed board, starting with the board itself."""
+    h = flip_horizontal(board)
+    v = flip_vertical(board)
+    hv = flip_vertical(h)
+    return [board, h, v, hv, transpose(board), transpose(h), transpose(v), transpose(hv)]
+
+
+def canonical(board):
+    """Representative of the symmetry class of a packed board (the smallest of its 8 symmetric variants)."""
+    return min(symmetries(board))
+
+
+def move(board, direction:int):
+    """Apply a move to a packed board.
+
+    :param board: packed board
+    :param direction: Directions are encoded as: 0 -> UP, 1 -> Down, 2 -> Left, 3 -> Right
+    :return: new packed board and the score gained (in multiples of the base number)
+    """
+    if direction < 2:
+        # UP or DOWN: the rows of the transposed board are the columns of the board
+        t = transpose(board)
+        r0 = t & ROW_MASK
+        r1 = (t >> 16) & ROW_MASK
+        r2 = (t >> 32) & ROW_MASK
+        r3 = t >> 48
+        table = COL_UP if direction == 0 else COL_DOWN
+        new_board = table[r0] | (table[r1] << 4) | (table[r2] << 8) | (table[r3] << 12)
+    else:
+        r0 = board & ROW_MASK
+        r1 = (board >> 16) & ROW_MASK
+        r2 = (board >> 32) & ROW_MASK
+        r3 = board >> 48
+        table = ROW_LEFT if direction == 2 else ROW_RIGHT
+        new_board = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+
+    return new_board, ROW_SCORE[r0] + ROW_SCORE[r1] + ROW_SCORE[r2] + ROW_SCORE[r3]
+
+
+def is_game_over(board):
+    """Whether no move changes the board anymore."""
+    for direction in range(4):
+        if move(board, direction)[0] != board:
+            return False
+    return True
+
+
+def get_cell(board, index:int):
+    return (board >> (CELL_BITS * index)) & MAX_CODE
+
+
+def set_cell(board, index:int, code:int):
+    shift = CELL_BITS * index
+    return (board & ~(MAX_CODE << shift)) | (code << shift)
+
+
+def empty_cells(board):
+    """Indices (4*x + y) of all empty cells of a packed board."""
+    return [ii for ii in range(SIZE * SIZE) if not (board >> (CELL_BITS * ii)) & MAX_CODE]
+
+
+def value_to_code(value:int, base_number:int, max_code:int=MAX_CODE):
+    """Convert a tile value to its tile code.
+
+    :param max_code: highest tile code that fits into a cell
+    :raises ValueError: If the value can not be represented in a packed board.
+    """
+    if value == 0:
+        return 0
+
+    multiple = value // base_number
+    if value % base_number != 0 or multiple & (multiple - 1) != 0:
+        raise ValueError(f"{value} is not the base number {base_number} times a power of 2.")
+
+    code = multiple.bit_length()
+    if code > max_code:
+        raise ValueError(f"{value} is too large for a tile (maximum is {code_to_value(max_code, base_number)}).")
+    return code
+
+
+def code_to_value(code:int, base_number:int):
+    return base_number << (code - 1) if code else 0
+
+
+def pack(field, base_number:int):
+    """Pack a numpy field of tile values into a board.
+
+    :param field: numpy array of shape (4, 4)
+    :param base_number: Base number of the game
+    :return: packed board
+    """
+    board = 0
+    for index, value in enumerate(np.asarray(field).ravel().tolist()):
+        board |= value_to_code(value, base_number) << (CELL_BITS * index)
+    return board
+
+
+def unpack_rows(board):
+    """Unpack a board into a list of rows of tile codes (plain python, no numpy)."""
+    return [[(board >> (CELL_BITS * (SIZE * x + y))) & MAX_CODE for y in range(SIZE)] for x in range(SIZE)]
+
+
+def unpack_codes(board):
+    """Unpack a board into a numpy array of tile codes of shape (4, 4)."""
+    return np.array([(board >> (CELL_BITS * ii)) & MAX_CODE for ii in range(SIZE * SIZE)],
+                    dtype=int).reshape(SIZE, SIZE)
+
+
+def unpack(board, base_number:int):
+    """Unpack a board into a numpy field of tile values of shape (4, 4)."""
+    codes = unpack_codes(board)
+    return np.where(codes > 0, base_number * np.left_shift(1, np.maximum(codes - 1, 0)), 0)
@@ -2,8 +2,10 @@ import tkinter as tk
 
 
 class ColorMapper:
-    def __init__(self, base=2):
+    def __init__(self, base=2, max_exponent=64):
         self.base = base
+        # Colors of all exponents up to max_exponent, computed once
+        self.colors = [self.get_color(exponent) for exponent in range(max_exponent + 1)]
 
     def get_color(self, exponent):
         # Determine the color based on the exponent value
@@ -40,12 +42,20 @@ class ColorMapper:
             return "#000000"  # Black for negative values
 
         # Calculate the exponent based on the base
-        exponent = 0
-        while value >= self.base:
-            value //= self.base
-            exponent += 1
+        if self.base == 2:
+            exponent = int(value).bit_length() - 1
+        else:
+            exponent = 0
+            while value >= self.base:
+                value //= self.base
+                exponent += 1
 
         # Get the color based on the exponent
+        return self.get_exponent_color(exponent)
+
+    def get_exponent_color(self, exponent):
+        if exponent < len(self.colors):
+            return self.colors[exponent]
         return self.get_color(exponent)
 
 
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import row_engine
+from game_grid import GameGrid
+from simulation import POLICIES, game_seeds, make_agent
+
+MANIFEST = "manifest.json"
+FORMAT = "2048-dataset-v1"
+
+
+def sample_dtype(frame_size:int):
+    """Fixed-width record of one position.
+
+    board: tile codes of the cells (row by row), move: chosen move, values: value of every move in the search of the
+    agent (nan for illegal moves and the random policy), score: game score at the position, final_score: score at the
+    end of the game, game: index of the game in the export
+    """
+    return np.dtype([("board", "u1", (frame_size * frame_size,)), ("move", "i1"), ("values", "<f4", (4,)),
+                     ("score", "<i8"), ("final_score", "<i8"), ("game", "<u4")])
+
+
+def play_samples(game:int, seed:int, policy:str='expectimax', depth:int=2, frame_size:int=4, max_moves:int=0,
+                 time_budget:float=0, rollout_no:int=100, base_number:int=2):
+    """Play one game and record every position with the decision of the agent.
+
+    :param game: index of the game (stored in the samples)
+    :param base_number: Base number of the game, the boards hold the tile codes relative to it.
+    :return: structured array of the samples (see sample_dtype)
+    """
+    grid = GameGrid(frame_size=frame_size, base_number=base_number, seed=seed)
+    agent = make_agent(policy, grid, seed, time_budget, rollout_no)
+
+    boards = []
+    moves = []
+    values = []
+    scores = []
+    while not grid.check_game_over() and (max_moves <= 0 or len(moves) < max_moves):
+        row_values = [np.nan] * 4
+        if agent is not None:
+            _, direction = agent.step(grid=grid, depth=depth)
+            for move, value in agent.root_values.items():
+                row_values[move] = value
+        else:
+            legal_moves = grid.legal_moves()
+            direction = legal_moves[int(grid.random() * len(legal_moves))]
+        if direction == -1:
+            break
+
+        boards.append(grid.board_rows(grid.board))
+        moves.append(direction)
+        values.append(row_values)
+        scores.append(grid.score)
+        grid.move(direction)
+
+    samples = np.zeros(len(moves), dtype=sample_dtype(frame_size))
+    if len(moves):
+        samples["board"] = np.array(boards, dtype=np.uint8).reshape(len(moves), -1)
+        samples["move"] = moves
+        samples["values"] = values
+        samples["score"] = scores
+        samples["final_score"] = grid.score
+        samples["game"] = game
+    return samples
+
+
+def _play_samples_task(task):
+    return play_samples(*task)
+
+
+class ShardWriter:
+    def __init__(self, directory:str, frame_size:int, shard_size:int=1 << 18):
+        """Collects samples and writes them into .npy shards of shard_size samples each (the last one may be shorter).
+        At most one shard is held in memory.
+
+        :param directory: Output directory, created if necessary.
+        :param shard_size: Samples per shard.
+        """
+        self.directory = directory
+        self.frame_size = frame_size
+        self.shard_size = shard_size
+        self.buffer = np.zeros(shard_size, dtype=sample_dtype(frame_size))
+        self.count = 0
+        self.shards = []
+
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, samples):
+        """Add a batch of samples (structured array), full shards are written right away."""
+        while len(samples):
+            taken = min(len(samples), self.shard_size - self.count)
+            self.buffer[self.count:self.count + taken] = samples[:taken]
+            self.count += taken
+            samples = samples[taken:]
+            if self.count == self.shard_size:
+                self.write_shard()
+
+    def write_shard(self):
+        if self.count == 0:
+            return
+        name = f"shard_{len(self.shards):05d}.npy"
+        np.save(os.path.join(self.directory, name), self.buffer[:self.count])
+        self.shards.append({"file": name, "samples": self.count})
+        self.count = 0
+
+    def close(self, manifest:dict):
+        """Write the last shard and the manifest.
+
+        :param manifest: additional entries of the manifest (e.g. the configuration of the export)
+        """
+        self.write_shard()
+        manifest = dict(manifest)
+        manifest.update({
+            "format": FORMAT,
+            "frame_size": self.frame_size,
+            "dtype": sample_dtype(self.frame_size).descr,
+            "samples": sum(shard["samples"] for shard in self.shards),
+            "shards": self.shards,
+        })
+        with open(os.path.join(self.directory, MANIFEST), "w") as file:
+            json.dump(manifest, file, indent=2)
+        return manifest
+
+
+def export(directory:str, games:int, policy:str='expectimax', depth:int=2, frame_size:int=4, seed:int=0,
+           workers:int=None, max_moves:int=0, time_budget:float=0, rollout_no:int=100, shard_size:int=1 << 18,
+           memo_size:int=None, base_number:int=2):
+    """Play games on a process pool and stream their samples into shards (see ShardWriter).
+
+    Every worker returns the samples of a whole game as one structured array, the games are written in order.
+
+    :param workers: Number of worker processes (None -> number of CPUs, 1 -> play in this process).
+    :param memo_size: Maximum cached rows of the move engines of frame sizes above 4 in every process (None ->
+        row_engine.DEFAULT_MEMO_SIZE, about 300 bytes per row).
+    :param base_number: Base number of the games (stored in the manifest).
+    :return: manifest of the export
+    """
+    tasks = [(game, game_seed, policy, depth, frame_size, max_moves, time_budget, rollout_no, base_number)
+             for game, game_seed in enumerate(game_seeds(seed, games))]
+    writer = ShardWriter(directory, frame_size, shard_size)
+
+    start = time.perf_counter()
+    if workers == 1:
+        row_engine.set_memo_size(memo_size)
+        for task in tasks:
+            writer.add(_play_samples_task(task))
+    else:
+        with Pool(processes=workers, initializer=row_engine.set_memo_size, initargs=(memo_size,)) as pool:
+            for samples in pool.imap(_play_samples_task, tasks):
+                writer.add(samples)
+
+    config = {"games": games, "policy": policy, "depth": depth, "seed": seed, "max_moves": max_moves,
+              "time_budget": time_budget, "rollout_no": rollout_no}
+    return writer.close({"config": config, "base_number": base_number, "duration": time.perf_counter() - start})
+
+
+def load(directory:str):
+    """Open an export.
+
+    :return: manifest, list of the shards as memory mapped structured arrays
+    """
+    with open(os.path.join(directory, MANIFEST)) as file:
+        manifest = json.load(file)
+    if manifest.get("format") != FORMAT:
+        raise ValueError(f"{directory} does not contain a dataset export.")
+
+    shards = [np.load(os.path.join(directory, shard["file"]), mmap_mode="r") for shard in manifest["shards"]]
+    return manifest, shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export positions of 2048 games played by the agent as dataset.")
+    parser.add_argument("output", help="Output directory for the shards and the manifest.")
+    parser.add_argument("--games", type=int, default=100, help="Number of games to play.")
+    parser.add_argument("--policy", choices=POLICIES, default='expectimax', help="Move selection policy.")
+    parser.add_argument("--depth", type=int, default=2, help="Search depth of the agent.")
+    parser.add_argument("--frame-size", type=int, default=4, help="Size of the game frame.")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed, every game gets its own derived seed.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--time-budget", type=float, default=0,
+                        help="Time per move in seconds, the depth is then the maximum depth (0 -> fixed depth).")
+    parser.add_argument("--rollouts", type=int, default=100, help="Rollouts per move of the Monte Carlo policy.")
+    parser.add_argument("--max-moves", type=int, default=0, help="Maximum moves per game (0 -> unlimited).")
+    parser.add_argument("--base-number", type=int, default=2, help="Base number of the games.")
+    parser.add_argument("--shard-size", type=int, default=1 << 18, help="Samples per shard.")
+    parser.add_argument("--row-memo", type=int, default=None,
+                        help="Cached rows of the move engine per process for frames above 4x4 (~300 bytes each).")
+    args = parser.parse_args()
+
+    manifest = export(args.output, games=args.games, policy=args.policy, depth=args.depth,
+                      frame_size=args.frame_size, seed=args.seed, workers=args.workers, max_moves=args.max_moves,
+                      time_budget=args.time_budget, rollout_no=args.rollouts, shard_size=args.shard_size,
+                      memo_size=args.row_memo, base_number=args.base_number)
+    print(f"{manifest['samples']} samples of {args.games} games in {len(manifest['shards'])} shards "
+          f"({manifest['duration']:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
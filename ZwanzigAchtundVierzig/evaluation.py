@@ -0,0 +1,154 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import bitboard
+
+# All 65536 possible rows of a packed board as tile codes, shape (65536, 4)
+ROW_CODES = np.array([[(key >> (bitboard.CELL_BITS * ii)) & bitboard.MAX_CODE for ii in range(bitboard.SIZE)]
+                      for key in range(bitboard.ROW_MASK + 1)], dtype=np.int64)
+
+# Registered heuristic terms: name -> function mapping the tile codes of all rows (ROW_CODES) to one value per row.
+# A board is evaluated as the sum over its 4 rows and 4 columns, so a term should be symmetric (give the same value
+# for a reversed row) to keep the evaluation invariant under rotating and mirroring the board.
+ROW_TERMS = {}
+
+# Weights in points of the game score, since the expectimax search adds the evaluation to the score of the merges
+DEFAULT_WEIGHTS = {
+    "empty": 20,
+    "merges": 20,
+    "monotonicity": 1,
+    "smoothness": 0,
+    "corner": 10,
+}
+
+# Tables of recently created evaluators, keyed by their weights. A table takes about 2 MB, so only the least recently
+# used ones are kept (tuning creates a new weight set for every candidate).
+TABLE_CACHE_SIZE = 4
+_table_cache = OrderedDict()
+
+
+def row_term(name:str):
+    """Decorator to register a heuristic term under a name. Weights refer to terms by this name."""
+    def register(function):
+        ROW_TERMS[name] = function
+        return function
+    return register
+
+
+@row_term("empty")
+def empty_term(codes):
+    """Number of empty cells."""
+    return (codes == 0).sum(axis=1)
+
+
+@row_term("merges")
+def merges_term(codes):
+    """Number of merges possible when moving along the row."""
+    keys = (codes << (bitboard.CELL_BITS * np.arange(bitboard.SIZE))).sum(axis=1)
+    left_codes = ROW_CODES[np.array(bitboard.ROW_LEFT)[keys]]
+    return (codes != 0).sum(axis=1) - (left_codes != 0).sum(axis=1)
+
+
+@row_term("monotonicity")
+def monotonicity_term(codes, power:float=4):
+    """Penalty for rows that are not monotonic: the smaller of the increases towards either side, with tiles weighted
+    by their code to the power of 4."""
+    weighted = codes.astype(float) ** power
+    steps = weighted[:, 1:] - weighted[:, :-1]
+    increasing = np.clip(steps, 0, None).sum(axis=1)
+    decreasing = np.clip(-steps, 0, None).sum(axis=1)
+    return -np.minimum(increasing, decreasing)
+
+
+@row_term("smoothness")
+def smoothness_term(codes):
+    """Penalty for differences between neighbouring tiles (empty cells are skipped)."""
+    penalty = np.zeros(len(codes))
+    for key, row in enumerate(codes.tolist()):
+        non_zeros = [code for code in row if code]
+        penalty[key] = sum(abs(a - b) for a, b in zip(non_zeros, non_zeros[1:]))
+    return -penalty
+
+
+@row_term("corner")
+def corner_term(codes):
+    """Code of the largest tile of the row if it lies at one of the ends of the row. Summed over rows and columns a
+    largest tile in a corner of the board counts twice."""
+    row_max = codes.max(axis=1)
+    at_end = (codes[:, 0] == row_max) | (codes[:, -1] == row_max)
+    return np.where(at_end, row_max, 0)
+
+
+class Evaluator:
+    def __init__(self, weights:dict=None):
+        """Heuristic evaluation of packed boards. Every registered term is precomputed for all possible rows and
+        combined into a single table using the weights, so evaluating a board takes 8 lookups (4 rows, 4 columns).
+
+        :param weights: term name -> weight. Missing terms use DEFAULT_WEIGHTS, terms not in DEFAULT_WEIGHTS
+            (registered with row_term) are only used if a weight is given.
+        """
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights is not None:
+            self.weights.update(weights)
+
+        unknown_terms = set(self.weights) - set(ROW_TERMS)
+        if unknown_terms:
+            raise ValueError(f"Unknown heuristic terms: {sorted(unknown_terms)}")
+
+        self.table = self.build_table(self.weights)
+        # A board is the sum of 8 rows and columns
+        self.lowest_value = 8 * min(self.table)
+
+    @staticmethod
+    def build_table(weights:dict):
+        key = tuple(sorted(weights.items()))
+        if key in _table_cache:
+            _table_cache.move_to_end(key)
+            return _table_cache[key]
+
+        values = np.zeros(len(ROW_CODES))
+        for name, weight in weights.items():
+            if weight:
+                values += weight * ROW_TERMS[name](ROW_CODES)
+        table = _table_cache[key] = values.tolist()
+        if len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+        return table
+
+    def min_value(self):
+        """Lower bound of the values of all boards."""
+        return self.lowest_value
+
+    def evaluate(self, board):
+        """Heuristic value of a packed board."""
+        table = self.table
+        mask = bitboard.ROW_MASK
+        t = bitboard.transpose(board)
+        return (table[board & mask] + table[(board >> 16) & mask] + table[(board >> 32) & mask] + table[board >> 48]
+                + table[t & mask] + table[(t >> 16) & mask] + table[(t >> 32) & mask] + table[t >> 48])
+
+
+# Row tables for the scoring of the greedy search (State.update_score)
+ROW_EQUAL_NEIGHBOURS = (ROW_CODES[:, 1:] == ROW_CODES[:, :-1]).sum(axis=1).tolist()
+ROW_MAX = ROW_CODES.max(axis=1).tolist()
+
+
+def equal_neighbours(board):
+    """Number of equal (also empty) horizontally or vertically neighbouring cells of a packed board."""
+    mask = bitboard.ROW_MASK
+    t = bitboard.transpose(board)
+    return (ROW_EQUAL_NEIGHBOURS[board & mask] + ROW_EQUAL_NEIGHBOURS[(board >> 16) & mask]
+            + ROW_EQUAL_NEIGHBOURS[(board >> 32) & mask] + ROW_EQUAL_NEIGHBOURS[board >> 48]
+            + ROW_EQUAL_NEIGHBOURS[t & mask] + ROW_EQUAL_NEIGHBOURS[(t >> 16) & mask]
+            + ROW_EQUAL_NEIGHBOURS[(t >> 32) & mask] + ROW_EQUAL_NEIGHBOURS[t >> 48])
+
+
+def largest_in_corner(board):
+    """Whether the largest tile of a packed board lies in one of its corners."""
+    mask = bitboard.ROW_MASK
+    largest = max(ROW_MAX[board & mask], ROW_MAX[(board >> 16) & mask], ROW_MAX[(board >> 32) & mask],
+                  ROW_MAX[board >> 48])
+    last = bitboard.SIZE * bitboard.SIZE - 1
+    corners = [0, bitboard.SIZE - 1, last - bitboard.SIZE + 1, last]
+    return any(bitboard.get_cell(board, index) == largest for index in corners)
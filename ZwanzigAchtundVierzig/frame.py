@@ -1,19 +1,23 @@
 import tkinter as tk
 from tkinter import messagebox
 
-import random
+import os
+import time
 
 from agent import Agent
 from game_grid import GameGrid
 from game_ui import GameUI
+from search_worker import SearchWorker
+from trajectory import SPAWN_ONLY, TrajectoryWriter
 
 
 class Frame:
     """Wrapper of the game ui and initialisation for the menus."""
-    def __init__(self, root):
+    def __init__(self, root, profile:dict=None):
         """GameUI + GameGrid Wrapper.
 
         :param root: tkinter object
+        :param profile: Agent profile with the weights of the AI search (see agent.load_profile), None -> defaults.
         """
         # General game variables
         self.root = root
@@ -23,14 +27,32 @@ class Frame:
         # Auto-play variables
         self.perform_auto_play = False
         self.agent = None
-        self.depth = 5
+        self.profile = profile or {}
+        self.depth = self.profile.get("depth", 5)
         self.ai_auto_play = True
+        self.search_mode = self.profile.get("search_mode", 'greedy')
+        self.time_budget_ms = 0
+        self.search_processes = 1  # processes of the expectimax search (1 -> in the search thread), see AI options
+        self.search_worker = None
+        self.search_result = None
+        self.auto_play_job = None
+        self.last_auto_play_move = 0
+        self.move_delay = 300  # ms between two moves of the automatic play
+        self.poll_interval = 20  # ms between two checks for a search result
+        self.ponder = True  # Search the positions after the chosen move while waiting for the move delay
+        self.show_search_stats = False
+        self.stats_file = None  # JSON lines file for the statistics of every search, None -> not written
+
+        # Recording of the games (see trajectory.py)
+        self.recorder = None
+        self.recording_dir = "recordings"
 
         # Setup Game & UI
         self.root.geometry("500x500")
         self.ui.grid_config()
         self.key_binds()
         self.menu_setup()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
         # Start the game
         self.restart()
@@ -52,27 +74,63 @@ class Frame:
         self.game_menu.add_command(label="Add Custom Value", command=lambda: self.add_custom_value())
 
         self.options_menu.add_command(label="Adjust Frame Size", command=lambda: self.frame_size_options())
+        self.options_menu.add_command(label="Toggle Search Statistics", command=lambda: self.toggle_search_stats())
+        self.options_menu.add_command(label="Toggle Recording", command=lambda: self.toggle_recording())
         self.options_menu.add_command(label="Help", command=lambda: self.help())
 
     def key_binds(self):
         """Setup key binds"""
-        self.root.bind("<Up>", lambda event: self.move(0))
-        self.root.bind("<Down>", lambda event: self.move(1))
-        self.root.bind("<Left>", lambda event: self.move(2))
-        self.root.bind("<Right>", lambda event: self.move(3))
+        self.root.bind("<Up>", lambda event: self.user_move(0))
+        self.root.bind("<Down>", lambda event: self.user_move(1))
+        self.root.bind("<Left>", lambda event: self.user_move(2))
+        self.root.bind("<Right>", lambda event: self.user_move(3))
         self.root.bind("<Escape>", lambda event: self.restart())
         self.root.bind("<Return>", lambda event: self.toggle_auto_play())
 
     def restart(self):
         """Restart game"""
+        if self.search_worker is not None:
+            self.search_worker.reset_agent()
+            self.search_result = None
+        elif self.agent is not None:
+            self.agent.reset()
         self.ui.restart()
         self.grid.restart(spawn_no=2)
         self.ui.setup()
 
+        if self.recorder is not None:
+            if (self.recorder.frame_size, self.recorder.base_number) != (self.grid.frame_size, self.grid.base_number):
+                # A recording only holds games with the same settings, continue in a new file
+                self.stop_recording()
+                self.start_recording()
+            else:
+                self.recorder.start_game(self.grid.board, self.grid.score, self.grid.seed_value)
+
+    def close(self):
+        """Close the window: stop the automatic play, the search thread with its processes and the recording."""
+        self.stop_auto_play()
+        if self.search_worker is not None:
+            self.search_worker.shutdown()
+            # A running search stops at its next node
+            self.search_worker.thread.join(timeout=5)
+            self.search_worker = None
+            self.agent = None
+        if self.recorder is not None:
+            self.stop_recording()
+        self.root.destroy()
+
+    def user_move(self, direction):
+        """Perform move requested by the user. A search of the automatic play for the old grid is cancelled."""
+        if self.search_worker is not None and self.search_worker.pending():
+            self.search_worker.cancel()
+        self.move(direction)
+
     def move(self, direction):
         """Perform move"""
         success = self.grid.move(direction)
         if success:
+            if self.recorder is not None:
+                self.recorder.record_turn(direction, self.grid.last_spawns)
             self.ui.update()
         else:
             if self.ui.grid.check_game_over():
@@ -80,6 +138,8 @@ class Frame:
 
     def end(self):
         """Game over"""
+        if self.recorder is not None:
+            self.recorder.flush()
         self.ui.end()
 
     def game_options(self):
@@ -275,7 +335,13 @@ class Frame:
             return
 
         # Call spawn method with custom_value
-        self.grid.spawn(spawn_no=1, custom_value=custom_value)
+        try:
+            self.grid.spawn(spawn_no=1, custom_value=custom_value)
+        except ValueError as error:
+            messagebox.showerror("Input Error", str(error))
+            return
+        if self.recorder is not None:
+            self.recorder.record_turn(SPAWN_ONLY, self.grid.last_spawns)
         self.ui.update()
         self.custom_value_window.destroy()
 
@@ -399,8 +465,35 @@ class Frame:
         self.depth_option.insert(0, str(getattr(self, 'depth', 1)))  # Default value or current depth
         self.depth_option.pack(pady=5)
 
+        # Time budget option
+        self.time_budget_option_label = tk.Label(self.ai_opts_window,
+                                                 text="Time per move in ms (0 -> fixed depth, else depth is the maximum):",
+                                                 bg='lightblue',
+                                                 font=('Arial', 10))
+        self.time_budget_option_label.pack(pady=(10, 0))
+        self.time_budget_option = tk.Entry(self.ai_opts_window,
+                                           font=('Arial', 12),
+                                           width=10)
+        self.time_budget_option.insert(0, str(self.time_budget_ms))
+        self.time_budget_option.pack(pady=5)
+
+        # Processes of the expectimax search
+        self.processes_option_label = tk.Label(self.ai_opts_window,
+                                               text="Processes of the expectimax search (1 -> no extra processes):",
+                                               bg='lightblue',
+                                               font=('Arial', 10))
+        self.processes_option_label.pack(pady=(10, 0))
+        self.processes_option = tk.Entry(self.ai_opts_window,
+                                         font=('Arial', 12),
+                                         width=10)
+        self.processes_option.insert(0, str(self.search_processes))
+        self.processes_option.pack(pady=5)
+
         # AI method selection
-        ai_method = 'ai' if self.ai_auto_play else 'random'
+        if not self.ai_auto_play:
+            ai_method = 'random'
+        else:
+            ai_method = 'ai' if self.search_mode == 'greedy' else self.search_mode
         self.ai_method_var = tk.StringVar(value=ai_method)
         random_radio = tk.Radiobutton(self.ai_opts_window,
                                       text="Random",
@@ -418,6 +511,22 @@ class Frame:
                                          font=('Arial', 10))
         ai_search_radio.pack()
 
+        ai_expectimax_radio = tk.Radiobutton(self.ai_opts_window,
+                                             text="AI Expectimax (4x4 only)",
+                                             variable=self.ai_method_var,
+                                             value='expectimax',
+                                             bg='lightblue',
+                                             font=('Arial', 10))
+        ai_expectimax_radio.pack()
+
+        ai_frontier_radio = tk.Radiobutton(self.ai_opts_window,
+                                           text="AI Search (vectorized, for low depths)",
+                                           variable=self.ai_method_var,
+                                           value='frontier',
+                                           bg='lightblue',
+                                           font=('Arial', 10))
+        ai_frontier_radio.pack()
+
         # Buttons frame for better organization
         button_frame = tk.Frame(self.ai_opts_window, bg='lightblue')
         button_frame.pack(pady=20)
@@ -451,21 +560,42 @@ class Frame:
     def save_ai_options(self):
         """Save the AI options and close the window."""
         depth_str = self.depth_option.get()
+        time_budget_str = self.time_budget_option.get()
+        processes_str = self.processes_option.get()
 
         if not depth_str.isdigit():
             messagebox.showerror("Input Error", "Please enter a valid integer for depth.")
             return
+        if not time_budget_str.isdigit():
+            messagebox.showerror("Input Error", "Please enter a valid integer for the time per move.")
+            return
+        if not processes_str.isdigit() or int(processes_str) < 1:
+            messagebox.showerror("Input Error", "Please enter a positive integer for the processes.")
+            return
 
         depth = int(depth_str)
         # Save the depth to the instance
         self.depth = depth
+        self.time_budget_ms = int(time_budget_str)
+        processes = int(processes_str)
 
         # You can set a variable for the AI method selection
-        if self.ai_method_var.get() == 'ai':
+        ai_method = self.ai_method_var.get()
+        if ai_method in ['ai', 'expectimax', 'frontier']:
             self.ai_auto_play = True
+            self.search_mode = 'greedy' if ai_method == 'ai' else ai_method
         else:
             self.ai_auto_play = False
 
+        if self.agent is not None:
+            if self.search_mode != self.agent.search_mode or processes != self.search_processes:
+                # Only the expectimax search uses the process pool, the next one starts it with the new size
+                self.agent.workers = processes
+                self.search_worker.close_agent()
+            self.agent.search_mode = self.search_mode
+            self.agent.time_budget = self.time_budget_ms / 1000
+        self.search_processes = processes
+
         self.ai_opts_window.destroy()
 
     def toggle_auto_play(self):
@@ -475,7 +605,10 @@ class Frame:
             print("AUTO PLAY ACTIVATED")
             print("----------------------------------------------------------------------------------------------------------------")
             if self.agent is None:
-                self.agent = Agent(ui=self.ui)
+                self.agent = Agent.from_profile(self.profile, ui=self.ui, search_mode=self.search_mode,
+                                                persist_table=True, time_budget=self.time_budget_ms / 1000,
+                                                stats_file=self.stats_file, workers=self.search_processes)
+                self.search_worker = SearchWorker(self.agent)
 
             self.perform_auto_play = True
             self.auto_play()
@@ -483,37 +616,129 @@ class Frame:
             print("----------------------------------------------------------------------------------------------------------------")
             print("AUTO PLAY DEACTIVATED")
             print("----------------------------------------------------------------------------------------------------------------")
-            self.perform_auto_play = False
+            self.stop_auto_play()
+
+    def toggle_search_stats(self):
+        """Show or hide the statistics of the last AI search below the field."""
+        self.show_search_stats = not self.show_search_stats
+        if not self.show_search_stats:
+            self.ui.hide_stats()
+        elif self.agent is not None:
+            self.ui.show_stats(self.agent.stats.format_last())
+        else:
+            self.ui.show_stats("No search yet")
+
+    def toggle_recording(self):
+        """Start or stop recording the games into a trajectory file in the recording directory."""
+        if self.recorder is None:
+            self.start_recording()
+        else:
+            self.stop_recording()
+
+    def start_recording(self):
+        """Record the current game (from its current board on) and all following games."""
+        os.makedirs(self.recording_dir, exist_ok=True)
+        name = time.strftime("2048_%Y%m%d_%H%M%S")
+        path = os.path.join(self.recording_dir, name + ".trj")
+        index = 1
+        while os.path.exists(path):
+            path = os.path.join(self.recording_dir, f"{name}_{index}.trj")
+            index += 1
+        self.recorder = TrajectoryWriter(path, frame_size=self.grid.frame_size, base_number=self.grid.base_number)
+        self.recorder.start_game(self.grid.board, self.grid.score, self.grid.seed_value)
+        print("Recording games to", path)
+
+    def stop_recording(self):
+        self.recorder.close()
+        print("Recording saved to", self.recorder.path)
+        self.recorder = None
+
+    def stop_auto_play(self):
+        """Stop the automatic play including a running search."""
+        self.perform_auto_play = False
+        if self.auto_play_job is not None:
+            self.root.after_cancel(self.auto_play_job)
+            self.auto_play_job = None
+        if self.search_worker is not None:
+            self.search_worker.cancel()
 
     def auto_play(self):
-        """Automatically perform random moves while auto_playing."""
-        if self.perform_auto_play:
-            game_over = False
+        """Automatically perform moves while auto_playing. The AI searches in a background thread, the result is
+        polled from the tkinter event loop."""
+        self.auto_play_job = None
+        if not self.perform_auto_play:
+            return
 
-            # AI or Random
-            if self.ai_auto_play:
-                _, direction = self.agent.step(grid=self.ui.grid, depth=self.depth)
-            else:
-                direction = random.randint(0, 3)
+        # AI or Random
+        if self.ai_auto_play:
+            # Search on a copy, the grid may change while searching (key press, restart)
+            self.search_worker.submit(self.grid.clone(), depth=self.depth)
+            self.auto_play_job = self.root.after(self.poll_interval, self.poll_auto_play)
+        else:
+            # Random legal move, -1 (game over) if there is none
+            legal_moves = self.grid.legal_moves()
+            self.perform_auto_play_move(legal_moves[int(self.grid.random() * len(legal_moves))] if legal_moves else -1)
+            # Schedule the next move
+            self.auto_play_job = self.root.after(self.move_delay, self.auto_play)
 
-            # Check for game over via ai
-            if direction == -1:
-                game_over = True
-            else:
-                # Perform move
-                self.move(direction)
-                # check for game over after move
-                if self.grid.check_game_over():
-                    game_over = True
-
-            # Game over
-            if game_over:
-                self.perform_auto_play = False
-                print("----------------------------------------------------------------------------------------------------------------")
-                print("AUTO PLAY GAME OVER")
-                print("----------------------------------------------------------------------------------------------------------------")
-                self.end()
+    def poll_auto_play(self):
+        """Check for the result of the background search and perform the move once the move delay has passed."""
+        self.auto_play_job = None
+        if not self.perform_auto_play:
+            return
 
-            # Schedule the next move
-            self.root.after(300, self.auto_play)
+        if self.search_result is None:
+            pending = self.search_worker.pending()
+            self.search_result = self.search_worker.poll()
+            if self.search_result is None and not pending:
+                # The search has been cancelled (restart, key press), search again on the current grid
+                self.auto_play()
+                return
+            if self.search_result is not None and self.ponder and self.search_result[1] != -1:
+                # Use the rest of the move delay to search the likely next positions, the next submit() stops it
+                self.search_worker.ponder(*self.search_result, depth=self.depth)
 
+        remaining_delay = self.move_delay - (time.perf_counter() - self.last_auto_play_move) * 1000
+        if self.search_result is None or remaining_delay > 0:
+            self.auto_play_job = self.root.after(self.poll_interval, self.poll_auto_play)
+            return
+
+        searched_grid, direction = self.search_result
+        self.search_result = None
+        if (searched_grid.frame_size != self.grid.frame_size
+                or self.grid.board_changed(searched_grid.board, self.grid.board)):
+            # The grid has changed while searching
+            self.auto_play()
+            return
+
+        self.perform_auto_play_move(direction)
+        if self.show_search_stats:
+            # The worker has finished the step, its statistics are complete
+            self.ui.show_stats(self.agent.stats.format_last())
+        # Start searching for the next move right away
+        self.auto_play()
+
+    def perform_auto_play_move(self, direction):
+        """Perform a move of the automatic play and handle the game over."""
+        game_over = False
+        self.last_auto_play_move = time.perf_counter()
+
+        # Check for game over via ai
+        if direction == -1:
+            game_over = True
+        else:
+            # Perform move
+            self.move(direction)
+            # check for game over after move
+            if self.grid.check_game_over():
+                game_over = True
+
+        # Game over
+        if game_over:
+            self.stop_auto_play()
+            print("----------------------------------------------------------------------------------------------------------------")
+            print("AUTO PLAY GAME OVER")
+            print("----------------------------------------------------------------------------------------------------------------")
+            if self.ai_auto_play and self.agent is not None:
+                print("Search latency of the game:", self.agent.stats.summary())
+            self.end()
@@ -1,49 +1,178 @@
+import copy
+
 import numpy as np
 
+import bitboard
+import row_engine
+
+# Random numbers are drawn from the generator of a grid in blocks of this size
+RANDOM_BLOCK = 1024
+
+
 class GameGrid:
-    def __init__(self, frame_size:int=4, base_number:int=2, percent_double_base_on_spawn=10):
+    def __init__(self, frame_size:int=4, base_number:int=2, percent_double_base_on_spawn=10, seed=None):
         """
 
         :param frame_size: Initial size of the game frame.
         :param base_number: Base number for the game.
         :param percent_double_base_on_spawn: Probability for 2*base_number to spawn in the game field.
+        :param seed: Seed for the random number generator of the grid (spawns). None -> random seed.
         """
         self.frame_size = frame_size
         self.base_number = base_number
         self.percent_double_base_on_spawn = percent_double_base_on_spawn
 
-        self.field = None
-        self.new_field = None
+        # The board is packed into an integer, field is only a decoded view of it. 4x4 games are played on a 64-bit
+        # bitboard (see bitboard.py, packed is then True), other frame sizes on a RowEngine (see row_engine.py).
+        self.engine = None
+        self.packed = False
+        self.board = None
+        self.new_board = None
+
+        # Caches for the current board, invalidated by set_board: decoded field, result of the four moves (see
+        # move_results) and the empty cells
+        self._field = None
+        self._moves = None
+        self._empty_cells = None
         self.score = 0
 
+        # Every grid draws from its own generator, so games are reproducible and independent of each other
+        self.rng = None
+        self.seed_value = None
+        self._randoms = []
+        self._random_index = 0
+        self.seed(seed)
+
+        # Tiles placed by the last spawn() as (cell index, tile code), e.g. for recording the game
+        self.last_spawns = []
+
         self.restart()
 
-    def restart(self, spawn_no:int=2):
+    def __getstate__(self):
+        # Engines are shared (and bitboard is a module), they are looked up again after unpickling
+        state = self.__dict__.copy()
+        state['engine'] = None
+        state['_field'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.engine = row_engine.get_engine(self.frame_size)
+
+    @property
+    def field(self):
+        """Game field as numpy array, decoded from the board on demand."""
+        if self._field is None:
+            self._field = self.engine.unpack(self.board, self.base_number)
+        return self._field
+
+    @field.setter
+    def field(self, field):
+        self.set_board(self.engine.pack(field, self.base_number))
+
+    @property
+    def new_field(self):
+        """Result of the last stack() as numpy array."""
+        return self.engine.unpack(self.new_board, self.base_number)
+
+    def set_board(self, board, empty_cells=None):
+        """Set the board and invalidate the caches of the previous board.
+
+        :param empty_cells: empty cells of the new board if they are already known
+        """
+        self.board = board
+        self._field = None
+        self._moves = None
+        self._empty_cells = empty_cells
+
+    def move_result(self, direction:int):
+        """Result of a move on the current board (new board, score gained), computed once per board."""
+        if self._moves is None:
+            self._moves = [None] * 4
+        result = self._moves[direction]
+        if result is None:
+            result = self._moves[direction] = self.board_move(self.board, direction)
+        return result
+
+    def move_results(self):
+        return [self.move_result(direction) for direction in range(4)]
+
+    def is_legal(self, direction:int):
+        """Whether a move changes the current board."""
+        return self.move_result(direction)[0] != self.board
+
+    @property
+    def legal_moves_mask(self):
+        """Bitmask of the moves that change the current board (bit 0 -> UP, ..., bit 3 -> RIGHT)."""
+        mask = 0
+        for direction in range(4):
+            if self.is_legal(direction):
+                mask |= 1 << direction
+        return mask
+
+    def legal_moves(self):
+        """Directions of all moves that change the current board."""
+        mask = self.legal_moves_mask
+        return [direction for direction in range(4) if mask >> direction & 1]
+
+    @property
+    def empty_cells(self):
+        """Indices (frame_size*x + y) of the empty cells of the current board."""
+        if self._empty_cells is None:
+            self._empty_cells = self.engine.empty_cells(self.board)
+        return self._empty_cells
+
+    @property
+    def empty_count(self):
+        return len(self.empty_cells)
+
+    def seed(self, seed=None):
+        """Start a new random number generator for the spawns."""
+        self.rng = np.random.default_rng(seed)
+        self.seed_value = seed if isinstance(seed, (int, np.integer)) else None
+        self._randoms = []
+        self._random_index = 0
+
+    def random(self):
+        """Uniform random number in [0, 1) from the generator of the grid."""
+        if self._random_index >= len(self._randoms):
+            # Single draws from a Generator are slow, draw a whole block at once
+            self._randoms = self.rng.random(RANDOM_BLOCK).tolist()
+            self._random_index = 0
+        value = self._randoms[self._random_index]
+        self._random_index += 1
+        return value
+
+    def restart(self, spawn_no:int=2, seed=None):
+        """Start a new game.
+
+        :param spawn_no: Number of tiles spawned on the empty board.
+        :param seed: If given, the random number generator is seeded again (see seed()).
+        """
+        if seed is not None:
+            self.seed(seed)
         self.score = 0
-        self.field = np.zeros((self.frame_size, self.frame_size), dtype=int)
+        self.engine = row_engine.get_engine(self.frame_size)
+        self.packed = self.engine is bitboard
+        self.set_board(0)
         self.spawn(spawn_no)
 
     def spawn(self, spawn_no:int, custom_value=None):
-        """
+        """Spawn one or several tiles at random empty positions.
 
+        :param spawn_no: Number of tiles to spawn.
         :param custom_value: A custom value to insert
         :return: Whether the spawning was successful
+        :raises ValueError: If the custom value can not be placed on the board.
         """
-        spawn_positions = np.argwhere(self.field == 0)
-        if spawn_positions.size < spawn_no:
+        # The empty cells are kept up to date while spawning, so the next spawn does not have to search them
+        empty_cells = list(self.empty_cells)
+        self.last_spawns = []
+        board = self.spawn_cells(self.board, empty_cells, spawn_no, custom_value, self.last_spawns)
+        if board is None:
             return False, self.score  # Game over
 
-        for ii in range(spawn_no):
-            pos = np.random.choice(range(len(spawn_positions)))
-            x, y = spawn_positions[pos]
-
-            if custom_value is not None:
-                self.field[x][y] = custom_value
-            else:
-                rand_num = np.random.randint(0, 100)
-                spawn_value = self.base_number * 2 if rand_num < self.percent_double_base_on_spawn else self.base_number
-                self.field[x][y] = spawn_value
-
+        self.set_board(board, empty_cells)
         return True, None
 
     def move(self, direction:int):
@@ -52,12 +181,11 @@ class GameGrid:
             # No change to the board
             return False
 
-        self.field = self.new_field.copy()
+        self.set_board(self.new_board)
         success, _ = self.spawn(spawn_no=1)
 
         return success
 
-
     def stack(self, direction:int, temp_field=None):
         """Stack the numbers in the grid in accordance with a given direction. The numbers are stacked back to front
         in perspective to the direction, e.g. [0, 2, 2, 2] is stacked to [0, 0, 2, 4].
@@ -66,69 +194,102 @@ class GameGrid:
         :param temp_field: Instance of a field to perform the stack on. If None is given, self.field will be used.
         :return: new field as numpy array
         """
-        if temp_field is None:
-            temp_field = self.field.copy()
-            expect_return = False
-        else:
-            expect_return = True
-
-        new_field = np.zeros_like(temp_field)
-
-        # If UP or DOWN transpose field
-        if direction in [0, 1]:
-            temp_field = temp_field.T
-
-        for index, row in enumerate(temp_field):
-            non_zeros = row[row!=0].tolist()
-            new_row = []
-            num_non_zero = len(non_zeros)
-
-            # If DOWN o RIGHT reverse the list
-            if direction in [1, 3]:
-                non_zeros = non_zeros[::-1]
-
-            skip = False
-            for ii, v in enumerate(non_zeros):
-                if skip:
-                    skip = False
-                    continue
-
-                # Stacking logic
-                if ii < num_non_zero-1 and non_zeros[ii] == non_zeros[ii+1]:
-                    new_row.append(non_zeros[ii] * 2)
-                    self.score += non_zeros[ii]*2
-                    skip = True
-                else:
-                    new_row.append(non_zeros[ii])
-
-            new_row += [0] * (self.frame_size - len(new_row))
-            # If DOWN o RIGHT reverse the list
-            if direction in [1, 3]:
-                new_row = new_row[::-1]
-
-            new_field[index] = new_row
-
-        # If UP or DOWN transpose field
-        if direction in [0, 1]:
-            new_field = new_field.T
-
-        if expect_return:
-            return new_field.copy()
-        else:
-            self.new_field = new_field.copy()
+        if temp_field is not None:
+            new_board, _ = self.board_move(self.engine.pack(temp_field, self.base_number), direction)
+            return self.engine.unpack(new_board, self.base_number)
+
+        self.new_board, score = self.move_result(direction)
+        self.score += score
 
     def check_changes(self):
-        return not (self.field == self.new_field).all()
+        return self.board_changed(self.board, self.new_board)
 
     def check_game_over(self):
-        for ii in range(4):
-            test_field = self.field.copy()
-            new_field = self.stack(direction=ii, temp_field=test_field)
-
-            if not (test_field == new_field).all():
-                return False
-
-        return True
+        if self._empty_cells and self.board:
+            # Known from the last spawn: a board with a tile and an empty cell always has a legal move
+            return False
+        return not any(self.is_legal(direction) for direction in range(4))
 
     def copy(self):
         return self.field.copy()
+
+    def clone(self, seed=None):
+        """Independent copy of the grid with the same settings, board and score.
+
+        :param seed: Seed for the generator of the copy. None -> a child generator of this grid's generator (which
+            does not change the numbers drawn by this grid).
+        """
+        grid = copy.copy(self)
+        grid._field = None
+        if grid._empty_cells is not None:
+            grid._empty_cells = list(grid._empty_cells)
+        grid.seed(seed if seed is not None else self.rng.spawn(1)[0])
+        return grid
+
+    # Operations on boards of this grid that leave the grid itself untouched (used by the search of the agent)
+
+    def board_move(self, board, direction:int):
+        """Move on a board without spawning a new tile.
+
+        :return: new board, score gained
+        """
+        new_board, score = self.engine.move(board, direction)
+        return new_board, score * self.base_number
+
+    def board_changed(self, board, new_board):
+        return new_board != board
+
+    def board_spawn(self, board, custom_value=None, spawn_no:int=1):
+        """Spawn tiles at random empty positions of a board.
+
+        :param custom_value: A custom value to insert
+        :param spawn_no: Number of tiles to spawn.
+        :return: new board, None if the board has not enough empty positions
+        """
+        return self.spawn_cells(board, self.engine.empty_cells(board), spawn_no, custom_value)
+
+    def spawn_cells(self, board, empty_cells:list, spawn_no:int=1, custom_value=None, spawned:list=None):
+        """Spawn tiles at random positions out of a list of empty cells. The used cells are removed from the list.
+
+        :param spawned: If given, (cell index, tile code) of every spawned tile is appended to this list.
+        :return: new board, None if there are not enough empty cells
+        """
+        for ii in range(spawn_no):
+            if not empty_cells:
+                return None
+            pos = empty_cells.pop(int(self.random() * len(empty_cells)))
+            code = self.spawn_code(custom_value)
+            board = self.engine.set_cell(board, pos, code)
+            if spawned is not None:
+                spawned.append((pos, code))
+        return board
+
+    def spawn_outcomes(self, board):
+        """All boards a random spawn can lead to, the most likely first.
+
+        :return: list of (probability, new board)
+        """
+        empty_cells = self.engine.empty_cells(board)
+        outcomes = []
+        prob_double = self.percent_double_base_on_spawn / 100
+        for value, value_prob in [(self.base_number, 1 - prob_double), (self.base_number * 2, prob_double)]:
+            if value_prob <= 0:
+                continue
+            code = self.engine.value_to_code(value, self.base_number)
+            outcomes += [(value_prob / len(empty_cells), self.engine.set_cell(board, pos, code)) for pos in empty_cells]
+        outcomes.sort(key=lambda outcome: -outcome[0])
+        return outcomes
+
+    def spawn_code(self, custom_value=None):
+        """Tile code of a new tile: custom_value if given, else randomly the base number or its double."""
+        if custom_value is not None:
+            spawn_value = custom_value
+        else:
+            rand_num = self.random() * 100
+            spawn_value = self.base_number * 2 if rand_num < self.percent_double_base_on_spawn else self.base_number
+
+        return self.engine.value_to_code(spawn_value, self.base_number)
+
+    def board_rows(self, board):
+        """Cells of a board as list of rows of tile codes."""
+        return self.engine.unpack_rows(board)
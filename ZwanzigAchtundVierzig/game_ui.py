@@ -12,35 +12,90 @@ class GameUI:
         self.grid = grid
         self.frame = []
         self.color_mapper = ColorMapper()
+        self.stats_overlay = None
+        self.scoreboard = None
+
+        # All labels ever created by (row, column), labels outside of the current frame size are hidden and reused
+        # when the frame grows again
+        self.labels = {}
+        # Tile codes and score currently shown, update() only touches the labels of cells that have changed
+        self.shown_codes = None
+        self.shown_score = None
+        # Text and color by tile code for the current base number
+        self.tile_styles = {}
         self.setup()
 
     def restart(self):
+        """Hide the field until the next setup. The labels are kept and reused."""
         for frame_row in self.frame:
             for label in frame_row:
-                label.destroy()
+                label.grid_remove()
 
         self.frame = []
-
+        self.shown_codes = None
+        self.shown_score = None
 
     def setup(self):
-        self.scoreboard = tk.Label(self.root, text="Score: 0", anchor="center")
+        if self.scoreboard is None:
+            self.scoreboard = tk.Label(self.root, text="Score: 0", anchor="center")
         self.scoreboard.grid(row=0, columnspan=self.grid.frame_size, sticky="nsew", padx=5, pady=5)
 
+        self.frame = []
         for ii in range(self.grid.frame_size):
             self.frame.append([])
             for jj in range(self.grid.frame_size):
-                field_element = tk.Label(self.root, text="0", bg="#FFFFFF", borderwidth=5, anchor="center")
-                field_element.grid(row=ii+1, column=jj, sticky="nsew", padx=5, pady=5)
+                field_element = self.labels.get((ii, jj))
+                if field_element is None:
+                    field_element = tk.Label(self.root, text="0", bg="#FFFFFF", borderwidth=5, anchor="center")
+                    field_element.grid(row=ii+1, column=jj, sticky="nsew", padx=5, pady=5)
+                    self.labels[(ii, jj)] = field_element
+                else:
+                    field_element.grid()
                 self.frame[ii].append(field_element)
 
+        # The base number may have changed
+        self.tile_styles = {}
+        self.shown_codes = None
+
+        if self.stats_overlay is not None:
+            # Keep the overlay below the (possibly resized) field
+            self.stats_overlay.grid(row=self.grid.frame_size+1, columnspan=self.grid.frame_size, sticky="nsew")
+
         self.update()
 
     def update(self):
-        self.scoreboard.config(text="Score: "+str(self.grid.score))
-        for xx in range(self.grid.frame_size):
-            for yy in range(self.grid.frame_size):
-                value = self.grid.field[xx][yy]
-                self.frame[xx][yy].config(text=str(value), bg=self.color_mapper.get_value_color(value))
+        if self.grid.score != self.shown_score:
+            self.scoreboard.config(text="Score: "+str(self.grid.score))
+            self.shown_score = self.grid.score
+
+        codes = self.grid.board_rows(self.grid.board)
+        shown_codes = self.shown_codes
+        for xx, row in enumerate(codes):
+            for yy, code in enumerate(row):
+                if shown_codes is None or shown_codes[xx][yy] != code:
+                    text, color = self.tile_style(code)
+                    self.frame[xx][yy].config(text=text, bg=color)
+        self.shown_codes = codes
+
+    def tile_style(self, code:int):
+        """Text and background color of a tile code."""
+        style = self.tile_styles.get(code)
+        if style is None:
+            value = self.grid.engine.code_to_value(code, self.grid.base_number)
+            style = self.tile_styles[code] = str(value), self.color_mapper.get_value_color(value)
+        return style
+
+    def show_stats(self, text:str):
+        """Show a text (statistics of the AI search) in a small overlay below the field."""
+        if self.stats_overlay is None:
+            self.stats_overlay = tk.Label(self.root, font=('Arial', 8), justify="left", anchor="w")
+            self.stats_overlay.grid(row=self.grid.frame_size+1, columnspan=self.grid.frame_size, sticky="nsew")
+        self.stats_overlay.config(text=text)
+
+    def hide_stats(self):
+        if self.stats_overlay is not None:
+            self.stats_overlay.destroy()
+            self.stats_overlay = None
 
     def grid_config(self):
         """Set the grid configuration."""
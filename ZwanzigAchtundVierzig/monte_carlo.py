@@ -0,0 +1,160 @@
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from agent import State
+from game_grid import GameGrid
+
+
+def rollouts(grid:GameGrid, first_move:int, rollout_no:int, seed:int, guided:bool=False, max_moves:int=0):
+    """Play random games until game over after a first move.
+
+    :param grid: GameGrid instance, the rollouts start from its board
+    :param first_move: move performed first (must change the board)
+    :param rollout_no: number of rollouts
+    :param seed: seed for the random moves and spawns
+    :param guided: choose the move with the highest merge score instead of a random move (ties are broken randomly)
+    :param max_moves: maximum moves per rollout (0 -> until game over)
+    :return: first move, sum of the final scores of all rollouts, number of rollouts
+    """
+    # Own copy of the grid: the rollouts must not draw from the generator of the game
+    grid = grid.clone(seed=seed)
+    start_board, first_score = grid.board_move(grid.board, first_move)
+
+    score_sum = 0
+    for ii in range(rollout_no):
+        board = grid.board_spawn(start_board)
+        score = grid.score + first_score
+        moves = 0
+
+        while board is not None and (max_moves <= 0 or moves < max_moves):
+            options = []
+            for direction in range(4):
+                new_board, gained = grid.board_move(board, direction)
+                if grid.board_changed(board, new_board):
+                    options.append((gained, new_board))
+            if not options:
+                break
+
+            if guided:
+                best_gain = max(gained for gained, _ in options)
+                options = [option for option in options if option[0] == best_gain]
+            gained, new_board = options[int(grid.random() * len(options))]
+
+            score += gained
+            board = grid.board_spawn(new_board)
+            moves += 1
+
+        score_sum += score
+
+    return first_move, score_sum, rollout_no
+
+
+def _rollouts_task(task):
+    return rollouts(*task)
+
+
+class MonteCarloAgent:
+    def __init__(self, rollout_no:int=100, time_budget:float=0, workers:int=None, guided:bool=False,
+                 max_moves:int=0, seed=None):
+        """Monte Carlo policy for the game 2048: every legal move is rated by the mean final score of random games
+        (rollouts) played after it. The rollouts run on a process pool that is kept for the lifetime of the agent.
+
+        :param rollout_no: Rollouts per move and step (ignored if a time budget is set).
+        :param time_budget: Time per step in seconds. If > 0 rollouts are played in rounds (one rollout per move and
+            worker) until the budget is spent.
+        :param workers: Number of worker processes (None -> number of CPUs, 1 -> rollouts in this process).
+        :param guided: Play the rollouts with a greedy move choice (highest merge score) instead of random moves.
+        :param max_moves: Maximum moves per rollout (0 -> until game over).
+        :param seed: Seed for the rollouts.
+        """
+        self.rollout_no = rollout_no
+        self.time_budget = time_budget
+        self.workers = workers
+        self.guided = guided
+        self.max_moves = max_moves
+
+        self.rng = np.random.default_rng(seed)
+        self.pool = None
+
+        # Statistics of the last step: move -> [score sum, rollouts]
+        self.results = {}
+        # Mean score of every legal move of the last step (same as Agent.root_values)
+        self.root_values = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the process pool."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def reset(self):
+        """Nothing is kept between games, only for compatibility with Agent."""
+
+    def step(self, grid:GameGrid, depth:int=None):
+        """Select the move with the best mean final score of its rollouts.
+
+        :param grid: GameGrid instance
+        :param depth: not used, for compatibility with Agent.step
+        :return: state holding the best move and its mean final score as score, best move (-1 if no move possible)
+        """
+        legal_moves = grid.legal_moves()
+        self.root_values = {}
+        if not legal_moves:
+            return State(grid), -1
+
+        self.results = {direction: [0, 0] for direction in legal_moves}
+        if len(legal_moves) == 1:
+            best_move = legal_moves[0]
+        else:
+            if self.time_budget > 0:
+                deadline = time.perf_counter() + self.time_budget
+                while time.perf_counter() < deadline:
+                    self.run_round(grid, legal_moves, self.processes())
+            else:
+                self.run_round(grid, legal_moves, self.rollout_no)
+
+            best_move = max(legal_moves, key=lambda move: self.mean_score(move))
+
+        self.root_values = {move: self.mean_score(move) for move in legal_moves}
+        state = State(grid, root_move=best_move)
+        state.score = self.mean_score(best_move)
+        return state, best_move
+
+    def mean_score(self, move:int):
+        score_sum, count = self.results[move]
+        return score_sum / count if count else 0
+
+    def processes(self):
+        return self.workers or os.cpu_count() or 1
+
+    def get_pool(self):
+        """Process pool, started with the first step. None if the rollouts run in this process."""
+        if self.pool is None and self.processes() > 1:
+            self.pool = Pool(processes=self.processes())
+        return self.pool
+
+    def run_round(self, grid:GameGrid, legal_moves, rollout_no:int):
+        """Play rollout_no rollouts for every legal move, split into one task per move and worker."""
+        pool = self.get_pool()
+        chunks = self.processes()
+
+        tasks = []
+        for direction in legal_moves:
+            for chunk in np.array_split(np.arange(rollout_no), chunks):
+                if len(chunk):
+                    tasks.append((grid, direction, len(chunk), int(self.rng.integers(2**32)), self.guided,
+                                  self.max_moves))
+
+        results = map(_rollouts_task, tasks) if pool is None else pool.imap_unordered(_rollouts_task, tasks)
+        for direction, score_sum, count in results:
+            self.results[direction][0] += score_sum
+            self.results[direction][1] += count
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import bitboard
+from agent import Agent
+from evaluation import ROW_CODES
+from game_grid import GameGrid
+
+# Cell patterns (cell index 4*x + y) of the default network: two rows and three 2x2 squares. Every pattern is also
+# applied to the 7 other symmetric variants of the board, so it covers all rows/columns and squares of its kind.
+DEFAULT_PATTERNS = [
+    (0, 1, 2, 3),
+    (4, 5, 6, 7),
+    (0, 1, 4, 5),
+    (1, 2, 5, 6),
+    (5, 6, 9, 10),
+]
+
+
+class NTupleNetwork:
+    def __init__(self, patterns=None, weights=None):
+        """N-tuple network: the value of a packed 4x4 board is the sum of one lookup table weight per pattern and
+        symmetric variant of the board, indexed by the tile codes in the cells of the pattern.
+
+        The network estimates the score still to be gained after a move (the value of the board after the move,
+        before the spawn), so it can replace the heuristic evaluation of the expectimax search:
+        Agent(search_mode='expectimax', evaluator=network).
+
+        :param patterns: list of cell tuples, all of the same length. Defaults to DEFAULT_PATTERNS.
+        :param weights: flat float32 array with all lookup tables (e.g. memory mapped, see load()). Zeros if None.
+        """
+        self.patterns = [tuple(pattern) for pattern in (patterns or DEFAULT_PATTERNS)]
+        tuple_size = len(self.patterns[0])
+        if any(len(pattern) != tuple_size for pattern in self.patterns):
+            raise ValueError("All patterns must have the same number of cells.")
+
+        self.table_size = 1 << (bitboard.CELL_BITS * tuple_size)
+        if weights is None:
+            weights = np.zeros(len(self.patterns) * self.table_size, dtype=np.float32)
+        elif len(weights) != len(self.patterns) * self.table_size:
+            raise ValueError("The weights do not match the patterns.")
+        self.weights = weights
+
+        # Per pattern and row it covers: table mapping the row to its part of the lookup index (the offset of the
+        # pattern's weights is included in the part of the first row). A key is then put together from one table
+        # lookup per row instead of cell by cell.
+        self.row_tables = []
+        for index, pattern in enumerate(self.patterns):
+            parts = {}
+            for position, cell in enumerate(sorted(pattern)):
+                x, y = divmod(cell, bitboard.SIZE)
+                parts.setdefault(x, 0)
+                parts[x] = parts[x] + (ROW_CODES[:, y] << (bitboard.CELL_BITS * position))
+            tables = [(x, (parts[x] + (index * self.table_size if ii == 0 else 0)).tolist())
+                      for ii, x in enumerate(sorted(parts))]
+            self.row_tables.append(tables)
+
+    def indices(self, board):
+        """Positions in the weights of all lookups of a packed board (every pattern on all 8 symmetric variants)."""
+        mask = bitboard.ROW_MASK
+        reverse = bitboard.ROW_REVERSE
+        t = bitboard.transpose(board)
+        rows = (board & mask, (board >> 16) & mask, (board >> 32) & mask, board >> 48)
+        columns = (t & mask, (t >> 16) & mask, (t >> 32) & mask, t >> 48)
+        reversed_rows = tuple(reverse[row] for row in rows)
+        reversed_columns = tuple(reverse[column] for column in columns)
+
+        # Rows of the variants: the board, mirrored left/right, top/bottom and both, and the same for its transpose
+        variants = (rows, reversed_rows, rows[::-1], reversed_rows[::-1],
+                    columns, reversed_columns, columns[::-1], reversed_columns[::-1])
+        indices = []
+        for tables in self.row_tables:
+            x, table = tables[0]
+            keys = [table[variant[x]] for variant in variants]
+            for x, table in tables[1:]:
+                keys = [key + table[variant[x]] for key, variant in zip(keys, variants)]
+            indices += keys
+        return indices
+
+    def evaluate(self, board):
+        """Value of a packed board."""
+        return float(self.weights[self.indices(board)].sum())
+
+    def min_value(self):
+        """Lower bound of the values of all boards: the lowest weight of every lookup table, once per symmetric
+        variant."""
+        return 8 * float(np.asarray(self.weights).reshape(len(self.patterns), self.table_size).min(axis=1).sum())
+
+    def update(self, indices, error:float, alpha:float):
+        """Move the value of a board (given by its lookup indices) towards a target by alpha * error."""
+        np.add.at(self.weights, indices, alpha * error / len(indices))
+
+    def save(self, path:str):
+        """Write the weights as .npy file and the patterns into a .json file next to it."""
+        np.save(path, np.asarray(self.weights, dtype=np.float32))
+        with open(meta_path(path), "w") as file:
+            json.dump({"patterns": self.patterns}, file)
+
+
+def meta_path(path:str):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load(path:str, mmap:bool=True):
+    """Load a network written by NTupleNetwork.save().
+
+    :param mmap: Memory map the weights (read only, fast startup and shared between processes) instead of loading
+        them. Use mmap=False to continue training.
+    """
+    with open(meta_path(path)) as file:
+        meta = json.load(file)
+    weights = np.load(path, mmap_mode="r" if mmap else None)
+    return NTupleNetwork(patterns=meta["patterns"], weights=weights)
+
+
+def train(network:NTupleNetwork, games:int, alpha:float=0.1, seed=None, report_every:int=100):
+    """Train a network by temporal difference learning (TD(0) on the boards after the moves) in self-play.
+
+    Every move is chosen greedily by score gained plus value of the board after the move. The value of the previous
+    board after a move is then updated towards the value of the chosen move (0 at game over).
+
+    :param games: Number of games to play.
+    :param alpha: Learning rate, split over all lookups of a board.
+    :param seed: Seed for the spawns.
+    :param report_every: Print throughput and mean score every this many games (0 -> no reports).
+    :return: list of the final scores of all games
+    """
+    grid = GameGrid(frame_size=bitboard.SIZE, seed=seed)
+    weights = network.weights
+    scores = []
+    start = report_start = time.perf_counter()
+
+    for game in range(games):
+        grid.restart()
+        board = grid.board
+        score = 0
+        previous = None
+
+        while True:
+            best = None
+            for direction in range(4):
+                after, gained = grid.board_move(board, direction)
+                if after == board:
+                    continue
+                indices = network.indices(after)
+                value = gained + float(weights[indices].sum())
+                if best is None or value > best[0]:
+                    best = (value, gained, after, indices)
+
+            if best is None:
+                if previous is not None:
+                    network.update(previous[1], -previous[0], alpha)
+                break
+
+            value, gained, after, indices = best
+            if previous is not None:
+                network.update(previous[1], value - previous[0], alpha)
+            previous = (value - gained, indices)
+
+            score += gained
+            board = grid.board_spawn(after)
+
+        scores.append(score)
+        if report_every and (game + 1) % report_every == 0:
+            now = time.perf_counter()
+            recent = scores[-report_every:]
+            print(f"games {game + 1:>7}  mean score {np.mean(recent):>9.0f}  max score {max(recent):>7}  "
+                  f"{report_every / (now - report_start):.1f} games/s")
+            report_start = now
+
+    duration = time.perf_counter() - start
+    if games:
+        print(f"trained {games} games in {duration:.1f} s ({games / duration:.1f} games/s)")
+    return scores
+
+
+def evaluation_cost(network:NTupleNetwork, boards):
+    """Mean time of one evaluation in seconds."""
+    start = time.perf_counter()
+    for board in boards:
+        network.evaluate(board)
+    return (time.perf_counter() - start) / max(len(boards), 1)
+
+
+def play(network:NTupleNetwork, games:int, depth:int=1, seed:int=0):
+    """Play games with an expectimax agent using the network and report scores and search cost."""
+    scores = []
+    boards = []
+    nodes = 0
+    search_time = 0
+    for game in range(games):
+        grid = GameGrid(frame_size=bitboard.SIZE, seed=seed + game)
+        agent = Agent(grid=grid, search_mode='expectimax', evaluator=network, persist_table=True)
+        while not grid.check_game_over():
+            _, direction = agent.step(grid=grid, depth=depth)
+            nodes += agent.stats.last["nodes"] + agent.stats.last["leaves"]
+            search_time += agent.stats.last["wall_time"]
+            if direction == -1:
+                break
+            grid.move(direction)
+            boards.append(grid.board)
+        scores.append(grid.score)
+        print(f"game {game + 1:>4}  score {grid.score:>7}  max tile {grid.field.max():>6}")
+
+    print(f"mean score {np.mean(scores):.0f}, {search_time / max(len(boards), 1) * 1000:.2f} ms per move, "
+          f"{search_time / max(nodes, 1) * 1e6:.1f} us per node, "
+          f"{evaluation_cost(network, boards) * 1e6:.1f} us per evaluation")
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or play with an n-tuple network evaluator for 2048.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train a network in self-play.")
+    train_parser.add_argument("weights", help="Weight file (.npy) to write, continued if it exists.")
+    train_parser.add_argument("--games", type=int, default=1000, help="Number of training games.")
+    train_parser.add_argument("--alpha", type=float, default=0.1, help="Learning rate.")
+    train_parser.add_argument("--seed", type=int, default=None, help="Seed for the spawns.")
+    train_parser.add_argument("--report-every", type=int, default=100, help="Games between two reports.")
+
+    play_parser = subparsers.add_parser("play", help="Play games with the expectimax agent using a network.")
+    play_parser.add_argument("weights", help="Weight file (.npy).")
+    play_parser.add_argument("--games", type=int, default=10, help="Number of games.")
+    play_parser.add_argument("--depth", type=int, default=1, help="Search depth of the agent.")
+    play_parser.add_argument("--seed", type=int, default=0, help="Seed of the first game.")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        network = load(args.weights, mmap=False) if os.path.exists(args.weights) else NTupleNetwork()
+        train(network, args.games, alpha=args.alpha, seed=args.seed, report_every=args.report_every)
+        network.save(args.weights)
+    else:
+        play(load(args.weights), args.games, depth=args.depth, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
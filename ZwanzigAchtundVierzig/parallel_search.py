@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import time
+
+# Seconds between two checks for a cancelled search while waiting for the workers
+POLL_INTERVAL = 0.01
+
+# Agent of a worker process and the number of the search the main process is currently running (shared)
+_worker_agent = None
+_active_search = None
+
+
+class _SearchSwitch:
+    def __init__(self, search_id:int):
+        """Stop flag of a worker agent (Agent.stop_requested): true once the main process has moved on from the search
+        of the task, so a running task is cancelled at the next node instead of completing its subtree."""
+        self.search_id = search_id
+
+    def __bool__(self):
+        return _active_search.value != self.search_id
+
+
+def _init_worker(config:dict, active_search):
+    global _worker_agent, _active_search
+    # Imported here, the agent module uses this one
+    from agent import Agent
+    from game_grid import GameGrid
+
+    _worker_agent = Agent(grid=GameGrid(), search_mode='expectimax', **config)
+    _worker_agent.search_id = None
+    _active_search = active_search
+
+
+def _max_node_task(task):
+    """Search one spawn outcome of a root move in a worker: value of Agent.max_node and the counters of the search.
+
+    The task stops as soon as the search it belongs to is cancelled or replaced (see ParallelSearch.run).
+
+    :return: key of the task, value (None if the search was cancelled or timed out), counters
+    """
+    search_id, key, board, depth, prob, base_number, prob_double, persist_table, deadline = task
+    agent = _worker_agent
+    if _active_search.value != search_id or (deadline is not None and time.time() > deadline):
+        # Cancelled or out of time before the task started
+        return key, None, None
+
+    if agent.search_id != search_id:
+        # First task of a new search: the table is only kept for the same spawn rules (see Agent.prepare_search)
+        if agent.table is not None and (not persist_table or (agent.base_number, agent.prob_double)
+                                        != (base_number, prob_double)):
+            agent.table.clear()
+        agent.search_id = search_id
+        agent.base_number = base_number
+        agent.prob_double = prob_double
+
+    agent.stats.begin_step()
+    if agent.table is not None:
+        hits, misses = agent.table.hits, agent.table.misses
+    # The deadline is shipped as wall clock time, the search compares it with perf_counter
+    agent.deadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+
+    agent.stop_requested = _SearchSwitch(search_id)
+
+    # Local import, see _init_worker
+    from agent import SearchCancelled, SearchTimeout
+    try:
+        _, value = agent.max_node(board, depth, prob)
+    except SearchCancelled:
+        # Nobody waits for the result any more
+        return key, None, None
+    except SearchTimeout:
+        value = None
+    finally:
+        agent.deadline = None
+        agent.stop_requested = False
+
+    stats = agent.stats
+    counters = [stats.nodes, stats.leaves, stats.pruned, 0, 0]
+    if agent.table is not None:
+        counters[3:] = [agent.table.hits - hits, agent.table.misses - misses]
+    return key, value, counters
+
+
+class ParallelSearch:
+    def __init__(self, workers:int=None, agent_config:dict=None):
+        """Process pool searching the subtrees below the root of the expectimax search (see
+        Agent.parallel_chance_values). Every worker keeps its own Agent, including its transposition table, for the
+        lifetime of the pool, so start it once and use it for all steps.
+
+        Boards are shipped to the workers as packed integers, the values come back per task. The workers are spawned
+        as fresh interpreters instead of forked, so the pool can be started from any thread, e.g. the search thread of
+        the UI next to tkinter.
+
+        :param workers: Number of worker processes (None -> number of CPUs).
+        :param agent_config: Arguments for the Agent of every worker (prob_cutoff, table_size, evaluator).
+        """
+        self.workers = workers or os.cpu_count() or 1
+        # Number of the running search. Tasks of other searches are skipped by the workers.
+        context = multiprocessing.get_context("spawn")
+        self.active_search = context.RawValue('q', 0)
+        self.pool = context.Pool(processes=self.workers, initializer=_init_worker,
+                                 initargs=(agent_config or {}, self.active_search))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def run(self, tasks, is_cancelled=None):
+        """Search max nodes on the pool.
+
+        :param tasks: list of (key, packed board, depth, prob, base_number, prob_double, persist_table, deadline), the
+            deadline as time.time() value or None
+        :param is_cancelled: function checked while waiting, if it returns True the search is stopped and None returned
+        :return: list of (key, value, counters) in the order of completion (value None for timed out tasks) or None
+        """
+        self.active_search.value += 1
+        search_id = self.active_search.value
+        results = self.pool.imap_unordered(_max_node_task, [(search_id,) + tuple(task) for task in tasks])
+
+        completed = []
+        while len(completed) < len(tasks):
+            if is_cancelled is not None and is_cancelled():
+                # Queued tasks of this search are skipped by the workers
+                self.active_search.value += 1
+                return None
+            try:
+                completed.append(results.next(timeout=POLL_INTERVAL))
+            except multiprocessing.TimeoutError:
+                pass
+
+        return completed
@@ -0,0 +1,190 @@
+import numpy as np
+
+import bitboard
+
+# Fields of a row entry (see RowEngine.compute_row)
+LEFT = 0
+RIGHT = 1
+SCORE = 2
+SPREAD = 3
+EMPTY = 4
+
+# Maximum number of cached rows of a RowEngine without a full table. An entry takes about 300 bytes, so a full memo
+# costs about 40 MB in every process using the engine (each worker of a pool has its own).
+DEFAULT_MEMO_SIZE = 1 << 17
+
+# Engines by frame size, shared by all grids (and their row caches)
+_engines = {}
+
+
+class RowMemo(dict):
+    def __init__(self, compute, max_entries:int):
+        """Lazily filled cache of row entries. Entries are computed on the first access, the cache is emptied when it
+        grows beyond max_entries.
+
+        :param compute: function computing the entry of a row key
+        :param max_entries: Maximum number of cached rows.
+        """
+        super().__init__()
+        self.compute = compute
+        self.max_entries = max_entries
+
+    def __missing__(self, key):
+        if len(self) >= self.max_entries:
+            self.clear()
+        entry = self[key] = self.compute(key)
+        return entry
+
+
+class RowEngine:
+    def __init__(self, size:int, cell_bits:int=5, table_bits:int=16, memo_size:int=None):
+        """Move engine for boards of any size, packed into a single python integer. Same interface as bitboard.py.
+
+        Cell (x, y) is stored at bit position cell_bits * (size * x + y), so every row is an integer key of
+        size * cell_bits bits. The result of a move is looked up per row: in a table with all possible rows if it has
+        at most 2**table_bits entries, otherwise in a lazily filled cache with at most memo_size entries. Moves up and
+        down transpose the board, also row by row. With the default 5 bit cells only 3x3 boards get a full table, 5x5
+        and larger boards use the cache.
+
+        :param size: Size of the (square) board.
+        :param cell_bits: Bits per cell, the highest tile code is 2**cell_bits - 1.
+        :param table_bits: Precompute all rows if a row key has at most this many bits.
+        :param memo_size: Maximum number of cached rows otherwise (None -> DEFAULT_MEMO_SIZE, see there for the
+            memory per entry).
+        """
+        self.size = size
+        self.cell_bits = cell_bits
+        self.max_code = (1 << cell_bits) - 1
+        self.row_bits = size * cell_bits
+        self.row_mask = (1 << self.row_bits) - 1
+        self.row_shifts = [self.row_bits * ii for ii in range(size)]
+
+        if self.row_bits <= table_bits:
+            self.rows = [self.compute_row(key) for key in range(self.row_mask + 1)]
+        else:
+            self.rows = RowMemo(self.compute_row, memo_size or DEFAULT_MEMO_SIZE)
+
+    def compute_row(self, key:int):
+        """Entry of a row: keys after moving left and right, score of the merges, the row spread into the layout of
+        a column (cell ii at position size * ii) and the positions of its empty cells."""
+        cells = self.row_cells(key)
+
+        left, score = bitboard.slide_row(cells, self.max_code)
+        right, _ = bitboard.slide_row(cells[::-1], self.max_code)
+
+        spread = 0
+        for ii, code in enumerate(cells):
+            spread |= code << (self.cell_bits * self.size * ii)
+
+        empty = tuple(ii for ii, code in enumerate(cells) if code == 0)
+        return self.cells_to_row(left), self.cells_to_row(right[::-1]), score, spread, empty
+
+    def row_cells(self, key:int):
+        return [(key >> (self.cell_bits * ii)) & self.max_code for ii in range(self.size)]
+
+    def cells_to_row(self, cells):
+        key = 0
+        for ii, code in enumerate(cells):
+            key |= code << (self.cell_bits * ii)
+        return key
+
+    def transpose(self, board):
+        rows = self.rows
+        mask = self.row_mask
+        transposed = 0
+        for ii, shift in enumerate(self.row_shifts):
+            transposed |= rows[(board >> shift) & mask][SPREAD] << (self.cell_bits * ii)
+        return transposed
+
+    def move(self, board, direction:int):
+        """Apply a move to a packed board.
+
+        :param board: packed board
+        :param direction: Directions are encoded as: 0 -> UP, 1 -> Down, 2 -> Left, 3 -> Right
+        :return: new packed board and the score gained (in multiples of the base number)
+        """
+        if direction < 2:
+            board = self.transpose(board)
+
+        rows = self.rows
+        mask = self.row_mask
+        side = LEFT if direction in [0, 2] else RIGHT
+
+        new_board = 0
+        score = 0
+        for shift in self.row_shifts:
+            entry = rows[(board >> shift) & mask]
+            new_board |= entry[side] << shift
+            score += entry[SCORE]
+
+        if direction < 2:
+            new_board = self.transpose(new_board)
+        return new_board, score
+
+    def is_game_over(self, board):
+        for direction in range(4):
+            if self.move(board, direction)[0] != board:
+                return False
+        return True
+
+    def get_cell(self, board, index:int):
+        return (board >> (self.cell_bits * index)) & self.max_code
+
+    def set_cell(self, board, index:int, code:int):
+        shift = self.cell_bits * index
+        return (board & ~(self.max_code << shift)) | (code << shift)
+
+    def empty_cells(self, board):
+        """Indices (size*x + y) of all empty cells of a packed board."""
+        rows = self.rows
+        mask = self.row_mask
+        return [self.size * x + y for x, shift in enumerate(self.row_shifts)
+                for y in rows[(board >> shift) & mask][EMPTY]]
+
+    def value_to_code(self, value:int, base_number:int):
+        return bitboard.value_to_code(value, base_number, self.max_code)
+
+    def code_to_value(self, code:int, base_number:int):
+        return bitboard.code_to_value(code, base_number)
+
+    def pack(self, field, base_number:int):
+        board = 0
+        for index, value in enumerate(np.asarray(field).ravel().tolist()):
+            board |= self.value_to_code(value, base_number) << (self.cell_bits * index)
+        return board
+
+    def unpack_rows(self, board):
+        return [self.row_cells((board >> shift) & self.row_mask) for shift in self.row_shifts]
+
+    def unpack_codes(self, board):
+        return np.array(self.unpack_rows(board), dtype=int)
+
+    def unpack(self, board, base_number:int):
+        codes = self.unpack_codes(board)
+        return np.where(codes > 0, base_number * np.left_shift(1, np.maximum(codes - 1, 0)), 0)
+
+
+def get_engine(size:int):
+    """Move engine for a board size: the 64-bit bitboard for 4x4 boards, a (shared) RowEngine otherwise."""
+    if size == bitboard.SIZE:
+        return bitboard
+    if size not in _engines:
+        _engines[size] = RowEngine(size)
+    return _engines[size]
+
+
+def set_memo_size(memo_size:int=None):
+    """Set the maximum number of cached rows of all engines of this process, including the ones created later. Call it
+    in every worker process (e.g. as initializer of the pool) to limit their memory.
+
+    :param memo_size: Maximum number of cached rows per engine, None -> keep the current size.
+    """
+    global DEFAULT_MEMO_SIZE
+    if memo_size is None:
+        return
+    DEFAULT_MEMO_SIZE = memo_size
+    for engine in _engines.values():
+        if isinstance(engine.rows, RowMemo):
+            engine.rows.max_entries = memo_size
+            if len(engine.rows) > memo_size:
+                engine.rows.clear()
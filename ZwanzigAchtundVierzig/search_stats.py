@@ -0,0 +1,111 @@
+import json
+import time
+
+import numpy as np
+
+# Upper bounds (ms) of the buckets of the latency histogram, the last bucket holds everything above
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class SearchStats:
+    def __init__(self, stream_file:str=None):
+        """Counters and timers of the search of an Agent.
+
+        The counters are incremented directly by the search, begin_step() and end_step() frame one decision. The
+        record of the last decision is available as last, the latencies of all decisions of the current game as
+        latencies (see latency_histogram()).
+
+        :param stream_file: If given, every decision record is appended as one JSON line to this file.
+        """
+        self.stream_file = stream_file
+        self.game_no = 0
+        self.latencies = []
+        self.last = None
+
+        self.start_time = 0
+        self.nodes = 0
+        self.leaves = 0
+        self.pruned = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def new_game(self):
+        """Start a new game: clear the latencies of the previous one."""
+        self.game_no += 1
+        self.latencies = []
+        self.last = None
+
+    def begin_step(self):
+        self.start_time = time.perf_counter()
+        self.nodes = 0
+        self.leaves = 0
+        self.pruned = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def end_step(self, move:int, depth_reached:int, search_mode:str, pondered:bool=False):
+        """Finish a decision: store and (optionally) stream its record.
+
+        :param pondered: Whether the decision was taken from a search done in advance (the counters are 0 then).
+
+        :return: record of the decision
+        """
+        wall_time = time.perf_counter() - self.start_time
+        self.latencies.append(wall_time)
+
+        self.last = {
+            "game": self.game_no,
+            "decision": len(self.latencies),
+            "search_mode": search_mode,
+            "move": move,
+            "depth_reached": depth_reached,
+            "pondered": pondered,
+            "wall_time": wall_time,
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "pruned": self.pruned,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "nodes_per_sec": self.nodes / wall_time if wall_time > 0 else 0.0,
+        }
+
+        if self.stream_file is not None:
+            with open(self.stream_file, "a") as file:
+                file.write(json.dumps(self.last) + "\n")
+
+        return self.last
+
+    def latency_histogram(self):
+        """Histogram of the decision latencies of the current game.
+
+        :return: list of (upper bound of the bucket in ms, number of decisions), the last bound is inf
+        """
+        bounds = LATENCY_BUCKETS_MS + [float("inf")]
+        counts = np.histogram(np.array(self.latencies) * 1000, bins=[0] + bounds)[0]
+        return list(zip(bounds, counts.tolist()))
+
+    def summary(self):
+        """Latency summary of the current game."""
+        if not self.latencies:
+            return {"game": self.game_no, "decisions": 0}
+
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "game": self.game_no,
+            "decisions": len(latencies),
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(latencies.max()),
+            "histogram": self.latency_histogram(),
+        }
+
+    def format_last(self):
+        """Short text of the last decision for the overlay of the UI."""
+        if self.last is None:
+            return "No search yet"
+        if self.last["pondered"]:
+            return f"depth {self.last['depth_reached']}  pondered in advance"
+        return (f"depth {self.last['depth_reached']}  {self.last['wall_time'] * 1000:.0f} ms  "
+                f"{self.last['nodes']} nodes ({self.last['nodes_per_sec']:.0f}/s)\n"
+                f"leaves {self.last['leaves']}  pruned {self.last['pruned']}  cache hits {self.last['cache_hits']}")
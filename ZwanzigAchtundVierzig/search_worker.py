@@ -0,0 +1,131 @@
+import queue
+import threading
+
+from agent import Agent, SearchCancelled
+from game_grid import GameGrid
+
+
+class SearchWorker:
+    def __init__(self, agent:Agent):
+        """Runs the search of an agent in a background thread, so the (tkinter) main thread stays responsive.
+
+        Only the newest request is searched: submitting a new request or calling cancel() stops the search that is
+        currently running. Results are collected with poll().
+
+        :param agent: Agent performing the search. Must not be used by other threads while the worker is running.
+        """
+        self.agent = agent
+
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        # Requests are numbered, cancel() moves on to a new number so older results are ignored
+        self.request_id = 0
+        self.submitted_id = 0
+        self.done_id = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, grid:GameGrid, depth:int):
+        """Start the search for the best move on a grid. A search still running is cancelled.
+
+        :param grid: GameGrid instance. The worker searches on it, so pass an independent copy (GameGrid.clone()).
+        :param depth: depth for search
+        """
+        self.cancel()
+        self.submitted_id = self.request_id
+        self.requests.put((self.request_id, grid, depth))
+
+    def cancel(self):
+        """Cancel the running and all pending searches. Their results will not be delivered."""
+        self.request_id += 1
+        self.agent.stop_requested = True
+
+    def pending(self):
+        """Whether a request has been submitted (and not cancelled) whose search has not finished yet."""
+        return self.submitted_id == self.request_id and self.done_id != self.submitted_id
+
+    def poll(self):
+        """Get the result of the newest request if available.
+
+        :return: None or tuple of the searched grid and the best move (-1 if no move is possible)
+        """
+        result = None
+        while not self.results.empty():
+            request_id, grid, direction, error = self.results.get()
+            if error is not None:
+                raise error
+            if request_id == self.request_id:
+                result = grid, direction
+
+        return result
+
+    def ponder(self, grid:GameGrid, move:int, depth:int):
+        """Search the positions following a move in advance (see Agent.ponder), until the next submit() or cancel().
+
+        :param grid: the grid of the last result (see poll()), the move is not yet performed on it
+        :param move: move chosen for the grid
+        :param depth: depth of the steps
+        """
+        self.requests.put(('ponder', self.request_id, grid, move, depth))
+
+    def reset_agent(self):
+        """Cancel all searches and reset the agent (see Agent.reset) in the worker thread, before the next search."""
+        self.cancel()
+        self.requests.put('reset')
+
+    def close_agent(self):
+        """Cancel all searches and shut down the process pool of the agent (see Agent.close) in the worker thread. The
+        pool is started again by the next parallel search."""
+        self.cancel()
+        self.requests.put('close')
+
+    def shutdown(self):
+        """Cancel all searches and stop the worker thread, the agent is closed before."""
+        self.cancel()
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                self.agent.close()
+                return
+            if request == 'reset':
+                self.agent.reset()
+                continue
+            if request == 'close':
+                self.agent.close()
+                continue
+
+            if request[0] == 'ponder':
+                self.run_ponder(*request[1:])
+                continue
+
+            request_id, grid, depth = request
+            self.agent.stop_requested = False
+            if request_id != self.request_id:
+                # Outdated before the search even started
+                continue
+
+            try:
+                _, direction = self.agent.step(grid=grid, depth=depth)
+                self.results.put((request_id, grid, direction, None))
+            except SearchCancelled:
+                pass
+            except Exception as error:
+                self.results.put((request_id, grid, -1, error))
+            finally:
+                self.done_id = request_id
+
+    def run_ponder(self, request_id:int, grid:GameGrid, move:int, depth:int):
+        self.agent.stop_requested = False
+        if request_id != self.request_id:
+            return
+
+        try:
+            self.agent.ponder(grid, move, depth)
+        except SearchCancelled:
+            pass
+        except Exception as error:
+            self.results.put((request_id, grid, -1, error))
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+import ntuple
+import row_engine
+from agent import Agent, load_profile
+from game_grid import GameGrid
+from monte_carlo import MonteCarloAgent
+from trajectory import TrajectoryWriter
+
+POLICIES = ['random', 'greedy', 'expectimax', 'frontier', 'monte_carlo']
+
+# N-tuple networks by weight file, loaded once per process
+_networks = {}
+
+
+def game_seeds(seed:int, games:int):
+    """Independent per-game seeds derived from one base seed."""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(games)]
+
+
+def make_agent(policy:str, grid:GameGrid, seed:int, time_budget:float=0, rollout_no:int=100, weights:str=None,
+               profile:dict=None):
+    """Agent for a policy playing a single game on a grid (None for the random policy).
+
+    :param weights: Weight file of an n-tuple network (see ntuple.py) used as evaluation of the expectimax search.
+    :param profile: Agent profile (see agent.load_profile) with the weights of the search, its search mode is
+        replaced by the policy.
+    """
+    if policy == 'random':
+        return None
+    if policy == 'monte_carlo':
+        # Games are played in parallel already, so the rollouts run in the process of the game
+        return MonteCarloAgent(rollout_no=rollout_no, time_budget=time_budget, workers=1, seed=seed)
+    evaluator = None
+    if weights is not None:
+        if weights not in _networks:
+            _networks[weights] = ntuple.load(weights)
+        evaluator = _networks[weights]
+    if profile is not None:
+        agent = Agent.from_profile(profile, grid=grid, search_mode=policy, persist_table=True,
+                                   time_budget=time_budget)
+        if evaluator is not None:
+            agent.evaluator = evaluator
+        return agent
+    return Agent(grid=grid, search_mode=policy, persist_table=True, time_budget=time_budget, evaluator=evaluator)
+
+
+def play_game(seed:int, policy:str='expectimax', depth:int=2, frame_size:int=4, max_moves:int=0,
+              time_budget:float=0, rollout_no:int=100, record:bool=False, weights:str=None, profile:dict=None):
+    """Play one full game without UI.
+
+    :param seed: Seed for the random number generator of the game.
+    :param policy: 'random', a search mode of the Agent ('greedy', 'expectimax', 'frontier') or 'monte_carlo'
+    :param depth: Search depth of the agent.
+    :param frame_size: Size of the game frame.
+    :param max_moves: Stop the game after this many moves (0 -> play until game over).
+    :param time_budget: Time per move of the agent in seconds (0 -> fixed depth, else depth is the maximum depth).
+    :param rollout_no: Rollouts per move of the Monte Carlo policy (games are already played in parallel, so its
+        rollouts run in the process of the game).
+    :param record: Add the trajectory of the game (initial board and all turns, see TrajectoryWriter.write_game)
+        to the results.
+    :param weights: Weight file of an n-tuple network for the evaluation of the expectimax search.
+    :param profile: Agent profile with the weights of the search (see agent.load_profile).
+    :return: dict with the results of the game
+    """
+    grid = GameGrid(frame_size=frame_size, seed=seed)
+    agent = make_agent(policy, grid, seed, time_budget, rollout_no, weights, profile)
+
+    moves = 0
+    decision_times = []
+    initial_board = grid.board
+    turns = []
+    start = time.perf_counter()
+
+    while not grid.check_game_over() and (max_moves <= 0 or moves < max_moves):
+        decision_start = time.perf_counter()
+        if agent is not None:
+            _, direction = agent.step(grid=grid, depth=depth)
+        else:
+            # Random legal move, there is one as long as the game is not over
+            legal_moves = grid.legal_moves()
+            direction = legal_moves[int(grid.random() * len(legal_moves))]
+        decision_times.append(time.perf_counter() - decision_start)
+
+        if direction == -1:
+            break
+        if grid.move(direction):
+            moves += 1
+            if record:
+                turns.append((direction, grid.last_spawns))
+
+    result = {
+        "seed": seed,
+        "score": int(grid.score),
+        "max_tile": int(grid.field.max()),
+        "moves": moves,
+        "duration": time.perf_counter() - start,
+        "decision_times": np.array(decision_times, dtype=np.float32),
+    }
+    if record:
+        result["trajectory"] = (initial_board, turns)
+    return result
+
+
+def _play_game_task(task):
+    return play_game(*task)
+
+
+def run(games:int, policy:str='expectimax', depth:int=2, frame_size:int=4, seed:int=0, workers:int=None,
+        max_moves:int=0, time_budget:float=0, rollout_no:int=100, record:str=None, weights:str=None,
+        profile:dict=None, memo_size:int=None):
+    """Play several games on a process pool.
+
+    :param games: Number of games.
+    :param workers: Number of worker processes (None -> number of CPUs, 1 -> play in this process).
+    :param record: If given, the games are recorded into this trajectory file (see trajectory.py).
+    :param weights: Weight file of an n-tuple network for the evaluation of the expectimax search.
+    :param profile: Agent profile with the weights of the search (see agent.load_profile).
+    :param memo_size: Maximum cached rows of the move engines of frame sizes above 4 in every process (None ->
+        row_engine.DEFAULT_MEMO_SIZE, about 300 bytes per row).
+    :return: list of game results (see play_game) ordered by game, wall clock time in seconds
+    """
+    tasks = [(game_seed, policy, depth, frame_size, max_moves, time_budget, rollout_no, record is not None, weights,
+              profile) for game_seed in game_seeds(seed, games)]
+
+    # Recorded games are written as soon as they arrive (in order), so their turns are not kept until the end
+    writer = TrajectoryWriter(record, frame_size=frame_size) if record is not None else None
+    results = []
+
+    def collect(result):
+        if writer is not None:
+            initial_board, turns = result.pop("trajectory")
+            writer.write_game(initial_board, turns, seed=result["seed"])
+        results.append(result)
+
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            row_engine.set_memo_size(memo_size)
+            for task in tasks:
+                collect(_play_game_task(task))
+        else:
+            with Pool(processes=workers, initializer=row_engine.set_memo_size, initargs=(memo_size,)) as pool:
+                for result in pool.imap(_play_game_task, tasks, chunksize=max(1, games // (8 * (workers or 8)))):
+                    collect(result)
+    finally:
+        if writer is not None:
+            writer.close()
+    wall_time = time.perf_counter() - start
+
+    return results, wall_time
+
+
+def summarize(results, wall_time:float):
+    """Aggregate statistics over the results of several games."""
+    scores = np.array([r["score"] for r in results])
+    moves = np.array([r["moves"] for r in results])
+    decision_times = np.concatenate([r["decision_times"] for r in results])
+
+    def distribution(values):
+        return {
+            "mean": float(np.mean(values)),
+            "std": float(np.std(values)),
+            "min": float(np.min(values)),
+            "p25": float(np.percentile(values, 25)),
+            "median": float(np.median(values)),
+            "p75": float(np.percentile(values, 75)),
+            "max": float(np.max(values)),
+        }
+
+    max_tiles = Counter(r["max_tile"] for r in results)
+
+    return {
+        "games": len(results),
+        "wall_time": wall_time,
+        "score": distribution(scores),
+        "moves_per_game": distribution(moves),
+        "max_tile_histogram": {str(tile): max_tiles[tile] for tile in sorted(max_tiles)},
+        "moves_per_second": float(moves.sum() / wall_time) if wall_time > 0 else 0.0,
+        "decision_time": {
+            "mean": float(np.mean(decision_times)),
+            "p50": float(np.percentile(decision_times, 50)),
+            "p95": float(np.percentile(decision_times, 95)),
+            "p99": float(np.percentile(decision_times, 99)),
+            "max": float(np.max(decision_times)),
+        },
+    }
+
+
+def write_json(path:str, summary:dict, results, config:dict):
+    games = [{key: value for key, value in r.items() if key != "decision_times"} for r in results]
+    with open(path, "w") as file:
+        json.dump({"config": config, "summary": summary, "games": games}, file, indent=2)
+
+
+def write_csv(path:str, results):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["game", "seed", "score", "max_tile", "moves", "duration", "mean_decision_time"])
+        for index, r in enumerate(results):
+            mean_decision = float(np.mean(r["decision_times"])) if len(r["decision_times"]) else 0.0
+            writer.writerow([index, r["seed"], r["score"], r["max_tile"], r["moves"], r["duration"], mean_decision])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play 2048 games without UI and report statistics.")
+    parser.add_argument("--games", type=int, default=100, help="Number of games to play.")
+    parser.add_argument("--policy", choices=POLICIES, default=None, help="Move selection policy (default: expectimax).")
+    parser.add_argument("--depth", type=int, default=None, help="Search depth of the agent (default: 2).")
+    parser.add_argument("--frame-size", type=int, default=4, help="Size of the game frame.")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed, every game gets its own derived seed.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--time-budget", type=float, default=0,
+                        help="Time per move in seconds, the depth is then the maximum depth (0 -> fixed depth).")
+    parser.add_argument("--rollouts", type=int, default=100, help="Rollouts per move of the Monte Carlo policy.")
+    parser.add_argument("--max-moves", type=int, default=0, help="Maximum moves per game (0 -> unlimited).")
+    parser.add_argument("--json", help="Write summary and per-game results as JSON to this file.")
+    parser.add_argument("--csv", help="Write per-game results as CSV to this file.")
+    parser.add_argument("--record", help="Record all games into this trajectory file.")
+    parser.add_argument("--weights", help="N-tuple network weight file used as evaluation by the expectimax policy.")
+    parser.add_argument("--profile", help="Agent profile (e.g. written by tuning.py) with the weights of the search, "
+                                          "also sets the default policy and depth.")
+    parser.add_argument("--row-memo", type=int, default=None,
+                        help="Cached rows of the move engine per process for frames above 4x4 (~300 bytes each).")
+    args = parser.parse_args()
+
+    profile = None
+    if args.profile:
+        profile = load_profile(args.profile)
+        if args.policy is None:
+            args.policy = profile.get("search_mode")
+        if args.depth is None:
+            args.depth = profile.get("depth")
+    if args.policy is None:
+        args.policy = 'expectimax'
+    if args.depth is None:
+        args.depth = 2
+
+    results, wall_time = run(games=args.games, policy=args.policy, depth=args.depth, frame_size=args.frame_size,
+                             seed=args.seed, workers=args.workers, max_moves=args.max_moves,
+                             time_budget=args.time_budget, rollout_no=args.rollouts, record=args.record,
+                             weights=args.weights, profile=profile, memo_size=args.row_memo)
+    summary = summarize(results, wall_time)
+
+    if args.json:
+        write_json(args.json, summary, results, config=vars(args))
+    if args.csv:
+        write_csv(args.csv, results)
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
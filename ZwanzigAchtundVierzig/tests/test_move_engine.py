@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import batch_grid
+from game_grid import GameGrid
+
+
+def reference_stack(field, direction:int):
+    """Move of the original GameGrid.stack: new field and gained score."""
+    size = len(field)
+    if direction in [0, 1]:
+        field = field.T
+
+    new_field = np.zeros_like(field)
+    score = 0
+    for index, row in enumerate(field):
+        non_zeros = row[row != 0].tolist()
+        if direction in [1, 3]:
+            non_zeros = non_zeros[::-1]
+
+        new_row = []
+        skip = False
+        for ii, value in enumerate(non_zeros):
+            if skip:
+                skip = False
+                continue
+            if ii < len(non_zeros) - 1 and value == non_zeros[ii + 1]:
+                new_row.append(value * 2)
+                score += value * 2
+                skip = True
+            else:
+                new_row.append(value)
+
+        new_row += [0] * (size - len(new_row))
+        if direction in [1, 3]:
+            new_row = new_row[::-1]
+        new_field[index] = new_row
+
+    if direction in [0, 1]:
+        new_field = new_field.T
+    return new_field, score
+
+
+def random_fields(frame_size:int, count:int, seed:int):
+    """Random fields with many equal neighbours (so moves merge), tiles up to 2**11."""
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, 12, size=(count, frame_size, frame_size))
+    codes[rng.random(codes.shape) < 0.4] = 0
+    return np.where(codes > 0, 2 << np.maximum(codes - 1, 0), 0)
+
+
+@pytest.mark.parametrize("frame_size", range(3, 9))
+def test_moves_match_reference(frame_size):
+    grid = GameGrid(frame_size=frame_size, seed=0)
+    for field in random_fields(frame_size, 1000, seed=frame_size):
+        grid.field = field
+        for direction in range(4):
+            expected_field, expected_score = reference_stack(field, direction)
+            new_board, score = grid.move_result(direction)
+            assert np.array_equal(grid.engine.unpack(new_board, grid.base_number), expected_field)
+            assert score == expected_score
+
+
+@pytest.mark.parametrize("frame_size", range(3, 9))
+def test_batch_moves_match_reference(frame_size):
+    fields = random_fields(frame_size, 200, seed=100 + frame_size)
+    for direction in range(4):
+        new_fields, scores = batch_grid.stack_fields(fields, direction)
+        for field, new_field, score in zip(fields, new_fields, scores):
+            expected_field, expected_score = reference_stack(field, direction)
+            assert np.array_equal(new_field, expected_field)
+            assert score == expected_score
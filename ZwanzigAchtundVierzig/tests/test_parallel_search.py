@@ -0,0 +1,36 @@
+import pytest
+
+from agent import Agent
+from game_grid import GameGrid
+
+
+def positions(count:int, moves:int=30):
+    """Boards reached by playing a few moves of seeded games."""
+    grids = []
+    for seed in range(count):
+        grid = GameGrid(seed=seed)
+        for move in range(moves):
+            legal_moves = grid.legal_moves()
+            if not legal_moves:
+                break
+            grid.move(legal_moves[move % len(legal_moves)])
+        grids.append(grid)
+    return grids
+
+
+@pytest.fixture(scope="module")
+def parallel_agent():
+    # Without transposition tables the workers search exactly the same nodes as the serial search
+    agent = Agent(grid=GameGrid(), search_mode='expectimax', table_size=0, workers=2)
+    yield agent
+    agent.close()
+
+
+@pytest.mark.parametrize("depth", [2, 3])
+def test_parallel_search_matches_serial(parallel_agent, depth):
+    serial_agent = Agent(grid=GameGrid(), search_mode='expectimax', table_size=0)
+    for grid in positions(4):
+        _, serial_move = serial_agent.step(grid=grid, depth=depth)
+        _, parallel_move = parallel_agent.step(grid=grid, depth=depth)
+        assert parallel_move == serial_move
+        assert parallel_agent.root_values == serial_agent.root_values
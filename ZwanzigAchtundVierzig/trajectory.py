@@ -0,0 +1,262 @@
+import struct
+
+import numpy as np
+
+import bitboard
+import row_engine
+
+# File layout: header | turn records | game table | snapshot table. The tables are (re)written behind the turns on
+# every flush(), appending further turns overwrites them until the next flush.
+MAGIC = b"2048TRJ1"
+HEADER = struct.Struct("<8sHHIIQQQQ")  # magic, frame size, base number, snapshot interval, games, turns, snapshots,
+                                       # offset of the game table, offset of the snapshot table
+
+# One turn: move (0-3, SPAWN_ONLY for a spawn without move) and the tile spawned after it (NO_SPAWN if none)
+TURN_DTYPE = np.dtype([("move", "u1"), ("position", "u1"), ("code", "u1")])
+GAME_DTYPE = np.dtype([("seed", "<i8"), ("first_turn", "<u8"), ("turn_count", "<u4"), ("first_snapshot", "<u8"),
+                       ("score", "<i8")])
+SPAWN_ONLY = 4
+NO_SPAWN = 255
+NO_SEED = -1
+
+
+def board_bytes(frame_size:int):
+    """Bytes of a packed board of a frame size in the snapshot table."""
+    engine = row_engine.get_engine(frame_size)
+    cell_bits = bitboard.CELL_BITS if engine is bitboard else engine.cell_bits
+    return (cell_bits * frame_size * frame_size + 7) // 8
+
+
+def snapshot_dtype(frame_size:int):
+    return np.dtype([("score", "<i8"), ("board", "u1", (board_bytes(frame_size),))])
+
+
+def apply_turn(engine, base_number:int, board, score:int, move:int, position:int, code:int):
+    """Replay one turn on a packed board.
+
+    :return: board and score after the turn
+    """
+    if move != SPAWN_ONLY:
+        board, gained = engine.move(board, move)
+        score += gained * base_number
+    if position != NO_SPAWN:
+        board = engine.set_cell(board, position, code)
+    return board, score
+
+
+class TrajectoryWriter:
+    def __init__(self, path:str, frame_size:int=4, base_number:int=2, snapshot_interval:int=64):
+        """Records 2048 games into a compact binary file: 3 bytes per turn (move, spawn position, spawn code) plus a
+        snapshot of the board every snapshot_interval turns, so any turn can be reached by replaying less than
+        snapshot_interval turns (see TrajectoryReader).
+
+        All games of a file have the same frame size and base number. Call flush() (done by end_game()) or close()
+        to make the file readable.
+
+        :param path: File to write, an existing file is overwritten.
+        :param frame_size: Size of the game frame (at most 15, cell indices are stored in a byte).
+        :param base_number: Base number of the games.
+        :param snapshot_interval: Turns between two board snapshots.
+        """
+        if frame_size * frame_size >= NO_SPAWN:
+            raise ValueError(f"Frame size {frame_size} is too large for recording.")
+
+        self.path = path
+        self.frame_size = frame_size
+        self.base_number = base_number
+        self.snapshot_interval = snapshot_interval
+        self.engine = row_engine.get_engine(frame_size)
+        self.board_bytes = board_bytes(frame_size)
+
+        self.file = open(path, "w+b")
+        self.file.write(bytes(HEADER.size))
+
+        self.games = []
+        self.snapshots = []
+        self.turn_count = 0
+        # Turns not yet written to the file
+        self.buffer = bytearray()
+
+        # Game being recorded
+        self.game = None
+        self.board = 0
+        self.score = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start_game(self, board, score:int=0, seed:int=None):
+        """Start recording a new game (the current one is ended).
+
+        :param board: packed initial board (after the initial spawns)
+        :param score: initial score
+        :param seed: seed of the game if known
+        """
+        self.end_game(flush=False)
+        self.game = [NO_SEED if seed is None else seed, self.turn_count, 0, len(self.snapshots), score]
+        self.board = board
+        self.score = score
+        self.add_snapshot()
+
+    def record_turn(self, move:int, spawns=()):
+        """Record a move and the tiles spawned after it.
+
+        :param move: direction of the move, SPAWN_ONLY for tiles spawned without a move
+        :param spawns: list of (cell index, tile code), see GameGrid.last_spawns. Several tiles are stored as
+            several turns, all but the first as SPAWN_ONLY.
+        """
+        if not spawns:
+            self.add_turn(move, NO_SPAWN, 0)
+        for position, code in spawns:
+            self.add_turn(move, position, code)
+            move = SPAWN_ONLY
+
+    def add_turn(self, move:int, position:int, code:int):
+        self.board, self.score = apply_turn(self.engine, self.base_number, self.board, self.score, move, position,
+                                            code)
+        self.buffer += bytes((move, position, code))
+        self.turn_count += 1
+        self.game[2] += 1
+        if self.game[2] % self.snapshot_interval == 0:
+            self.add_snapshot()
+
+        if len(self.buffer) >= 1 << 16:
+            self.write_buffer()
+
+    def add_snapshot(self):
+        self.snapshots.append((self.score, self.board.to_bytes(self.board_bytes, "little")))
+
+    def write_game(self, board, turns, score:int=0, seed:int=None):
+        """Record a whole game.
+
+        :param board: packed initial board
+        :param turns: list of (move, spawns) as for record_turn
+        """
+        self.start_game(board, score, seed)
+        for move, spawns in turns:
+            self.record_turn(move, spawns)
+        self.end_game()
+
+    def end_game(self, flush:bool=True):
+        if self.game is not None:
+            self.game[4] = self.score
+            self.games.append(tuple(self.game))
+            self.game = None
+        if flush:
+            self.flush()
+
+    def write_buffer(self):
+        self.file.seek(HEADER.size + 3 * (self.turn_count - len(self.buffer) // 3))
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def flush(self):
+        """Write the tables and the header, the file is readable afterwards (including the game being recorded)."""
+        self.write_buffer()
+
+        games = list(self.games)
+        if self.game is not None:
+            games.append(tuple(self.game[:4]) + (self.score,))
+        game_table = np.array(games, dtype=GAME_DTYPE)
+
+        snapshot_table = np.zeros(len(self.snapshots), dtype=snapshot_dtype(self.frame_size))
+        if self.snapshots:
+            snapshot_table["score"] = [score for score, _ in self.snapshots]
+            snapshot_table["board"] = np.frombuffer(b"".join(board for _, board in self.snapshots),
+                                                    dtype=np.uint8).reshape(len(self.snapshots), self.board_bytes)
+
+        games_offset = HEADER.size + 3 * self.turn_count
+        snapshots_offset = games_offset + game_table.nbytes
+        self.file.seek(games_offset)
+        self.file.write(game_table.tobytes())
+        self.file.write(snapshot_table.tobytes())
+        self.file.truncate()
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.frame_size, self.base_number, self.snapshot_interval, len(games),
+                                    self.turn_count, len(self.snapshots), games_offset, snapshots_offset))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.end_game()
+            self.file.close()
+            self.file = None
+
+
+class TrajectoryReader:
+    def __init__(self, path:str):
+        """Read access to a file written by TrajectoryWriter. The tables are memory mapped, so only the parts of the
+        file that are accessed are loaded.
+
+        :param path: trajectory file
+        """
+        with open(path, "rb") as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+        (magic, self.frame_size, self.base_number, self.snapshot_interval, game_count, turn_count, snapshot_count,
+         games_offset, snapshots_offset) = header
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file.")
+
+        self.engine = row_engine.get_engine(self.frame_size)
+        self.turns = self.memmap(path, TURN_DTYPE, HEADER.size, turn_count)
+        self.games = self.memmap(path, GAME_DTYPE, games_offset, game_count)
+        self.snapshots = self.memmap(path, snapshot_dtype(self.frame_size), snapshots_offset, snapshot_count)
+
+    @staticmethod
+    def memmap(path:str, dtype, offset:int, count:int):
+        if count == 0:
+            # Empty files can not be mapped
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+    def __len__(self):
+        return len(self.games)
+
+    def game(self, index:int):
+        """Seed (None if unknown), number of turns and final score of a game."""
+        seed, _, turn_count, _, score = self.games[index].tolist()
+        return {"seed": None if seed == NO_SEED else seed, "turns": turn_count, "score": score}
+
+    def game_turns(self, index:int):
+        """Turn records (structured array with move, position and code) of a game."""
+        first_turn = int(self.games[index]["first_turn"])
+        return self.turns[first_turn:first_turn + int(self.games[index]["turn_count"])]
+
+    def board_at(self, index:int, turn:int):
+        """Packed board and score of a game after a number of turns (0 -> initial board).
+
+        :raises IndexError: If the game has less turns.
+        """
+        _, first_turn, turn_count, first_snapshot, _ = self.games[index].tolist()
+        if not 0 <= turn <= turn_count:
+            raise IndexError(f"Game {index} has {turn_count} turns, turn {turn} requested.")
+
+        snapshot = self.snapshots[first_snapshot + turn // self.snapshot_interval]
+        board = int.from_bytes(snapshot["board"].tobytes(), "little")
+        score = int(snapshot["score"])
+
+        start = first_turn + turn - turn % self.snapshot_interval
+        for move, position, code in self.turns[start:first_turn + turn].tolist():
+            board, score = apply_turn(self.engine, self.base_number, board, score, move, position, code)
+        return board, score
+
+    def field_at(self, index:int, turn:int):
+        """Game field (numpy array of tile values) of a game after a number of turns."""
+        board, _ = self.board_at(index, turn)
+        return self.engine.unpack(board, self.base_number)
+
+    def replay(self, index:int, start:int=0):
+        """Iterate over the boards of a game from a turn on.
+
+        :return: generator of (turn, packed board, score), starting with the board after turn start
+        """
+        board, score = self.board_at(index, start)
+        yield start, board, score
+
+        for turn, (move, position, code) in enumerate(self.game_turns(index)[start:].tolist(), start + 1):
+            board, score = apply_turn(self.engine, self.base_number, board, score, move, position, code)
+            yield turn, board, score
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import bitboard
+
+
+class TranspositionTable:
+    def __init__(self, max_entries:int=500000, use_symmetries:bool=True):
+        """Bounded cache for search values of packed boards.
+
+        Entries are keyed by the board and the remaining search depth. Boards are canonicalised over the 8 symmetries
+        of the square, so rotated or mirrored positions share one entry. When the table is full the least recently
+        used entry is evicted.
+
+        :param max_entries: Maximum number of stored entries.
+        :param use_symmetries: Whether to canonicalise boards before storing / looking them up.
+        """
+        self.max_entries = max_entries
+        self.use_symmetries = use_symmetries
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, board, depth:int):
+        if self.use_symmetries:
+            board = bitboard.canonical(board)
+        return board, depth
+
+    def get(self, key):
+        """Look up a value for a key created by key().
+
+        :return: the stored value or None
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries. The counters are kept, use reset_stats() for those."""
+        self.entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate(),
+        }
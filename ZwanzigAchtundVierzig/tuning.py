@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+import evaluation
+import row_engine
+from agent import DEFAULT_SCORE_WEIGHTS, save_profile
+from simulation import play_game
+
+# Weights tuned for a search mode: profile entry and default weights (start of the search)
+PARAMETERS = {
+    'greedy': ("score_weights", DEFAULT_SCORE_WEIGHTS),
+    'frontier': ("score_weights", DEFAULT_SCORE_WEIGHTS),
+    'expectimax': ("evaluation_weights", evaluation.DEFAULT_WEIGHTS),
+}
+
+
+def generation_seeds(seed:int, generation:int, games:int):
+    """Seeds of the games of a generation, played by all of its candidates."""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence([seed, generation]).spawn(games)]
+
+
+def _play_candidate_task(task):
+    candidate, game_seed, profile, frame_size, max_moves = task
+    result = play_game(game_seed, policy=profile["search_mode"], depth=profile["depth"], frame_size=frame_size,
+                       max_moves=max_moves, profile=profile)
+    return candidate, result["score"]
+
+
+class Tuner:
+    def __init__(self, search_mode:str='greedy', depth:int=2, population:int=8, parents:int=None, games:int=8,
+                 sigma:float=0.3, frame_size:int=4, max_moves:int=0, seed:int=0):
+        """Evolution strategy for the weights of the agent search: the score weights of the greedy and frontier
+        search (State.update_score) or the heuristic weights of the expectimax evaluation (evaluation.Evaluator).
+
+        Every generation samples candidates from a normal distribution around the current mean (mirrored pairs), the
+        current mean itself is evaluated as first candidate. All candidates play the same seeded games, so they are
+        compared on equal spawns. The mean then moves to the weighted mean of the best candidates and the step size
+        of every weight follows their spread. The search runs in a space where every weight is scaled by the size of
+        its default (at least 1).
+
+        :param search_mode: 'greedy', 'frontier' or 'expectimax'
+        :param depth: Search depth of the agent in the games.
+        :param population: Number of sampled candidates per generation (rounded up to an even number).
+        :param parents: Number of best candidates the new mean is built of (default: half of the population).
+        :param games: Games played by every candidate per generation.
+        :param sigma: Initial step size (relative to the size of the default weights).
+        :param frame_size: Size of the game frame.
+        :param max_moves: Maximum moves per game (0 -> play until game over).
+        :param seed: Seed of the sampling and of the games.
+        """
+        if search_mode not in PARAMETERS:
+            raise ValueError(f"Unknown search mode '{search_mode}'.")
+
+        self.config = {
+            "search_mode": search_mode,
+            "depth": depth,
+            "population": population + population % 2,
+            "parents": parents or max(1, population // 2),
+            "games": games,
+            "sigma": sigma,
+            "frame_size": frame_size,
+            "max_moves": max_moves,
+            "seed": seed,
+        }
+        self.profile_key, defaults = PARAMETERS[search_mode]
+        self.names = sorted(defaults)
+        self.defaults = np.array([defaults[name] for name in self.names], dtype=float)
+        self.scales = np.maximum(np.abs(self.defaults), 1)
+
+        self.rng = np.random.default_rng(seed)
+        self.generation = 0
+        self.mean = np.zeros(len(self.names))
+        self.sigma = np.full(len(self.names), sigma)
+        self.best = None
+        self.history = []
+
+    def weights(self, vector):
+        """Weights (name -> value) of a point of the search space."""
+        return {name: float(value) for name, value in zip(self.names, self.defaults + self.scales * vector)}
+
+    def profile(self, vector, fitness:float=None):
+        """Agent profile of a point of the search space (see agent.load_profile)."""
+        profile = {
+            "search_mode": self.config["search_mode"],
+            "depth": self.config["depth"],
+            self.profile_key: self.weights(vector),
+        }
+        if fitness is not None:
+            profile["mean_score"] = fitness
+        return profile
+
+    def sample(self):
+        """Candidates of the next generation, the first one is the current mean."""
+        noise = self.rng.standard_normal((self.config["population"] // 2, len(self.names)))
+        noise = np.concatenate([np.zeros((1, len(self.names))), noise, -noise])
+        return self.mean + self.sigma * noise
+
+    def evaluate(self, candidates, pool:Pool=None):
+        """Mean score of every candidate over the games of the current generation."""
+        seeds = generation_seeds(self.config["seed"], self.generation, self.config["games"])
+        tasks = [(candidate, game_seed, self.profile(vector), self.config["frame_size"], self.config["max_moves"])
+                 for candidate, vector in enumerate(candidates) for game_seed in seeds]
+
+        if pool is None:
+            results = [_play_candidate_task(task) for task in tasks]
+        else:
+            results = pool.imap_unordered(_play_candidate_task, tasks)
+
+        scores = np.zeros(len(candidates))
+        for candidate, score in results:
+            scores[candidate] += score
+        return scores / len(seeds)
+
+    def update(self, candidates, fitness):
+        """Move the mean and the step sizes towards the best candidates."""
+        parents = self.config["parents"]
+        best = np.argsort(-fitness)[:parents]
+        # Logarithmically decreasing recombination weights, the best candidate counts most
+        recombination = np.log(parents + 0.5) - np.log(np.arange(1, parents + 1))
+        recombination /= recombination.sum()
+
+        selected = candidates[best]
+        new_mean = recombination @ selected
+        spread = np.sqrt(recombination @ (selected - self.mean) ** 2)
+        self.sigma = np.maximum(0.7 * self.sigma + 0.3 * spread, 1e-3)
+        self.mean = new_mean
+
+    def step(self, pool:Pool=None):
+        """Evaluate and select one generation.
+
+        :return: record of the generation
+        """
+        start = time.perf_counter()
+        candidates = self.sample()
+        fitness = self.evaluate(candidates, pool)
+
+        if self.best is None or fitness[0] > self.best["mean_score"]:
+            self.best = self.profile(candidates[0], float(fitness[0]))
+            self.best["generation"] = self.generation
+
+        record = {
+            "generation": self.generation,
+            "mean_score": float(fitness[0]),
+            "best_candidate_score": float(fitness.max()),
+            "population_score": float(fitness[1:].mean()),
+            "duration": time.perf_counter() - start,
+        }
+        self.update(candidates, fitness)
+        self.history.append(record)
+        self.generation += 1
+        return record
+
+    def state(self):
+        return {
+            "config": self.config,
+            "generation": self.generation,
+            "mean": self.mean.tolist(),
+            "sigma": self.sigma.tolist(),
+            "rng": self.rng.bit_generator.state,
+            "best": self.best,
+            "history": self.history,
+        }
+
+    def save_checkpoint(self, path:str):
+        """Write the state of the search, replacing the previous checkpoint only when it is written completely."""
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.state(), file)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, path:str):
+        """Continue a search from a checkpoint.
+
+        :raises ValueError: If the checkpoint was written with another configuration.
+        """
+        with open(path) as file:
+            state = json.load(file)
+        if state["config"] != self.config:
+            raise ValueError(f"Checkpoint {path} was written with another configuration: {state['config']}")
+
+        self.generation = state["generation"]
+        self.mean = np.array(state["mean"])
+        self.sigma = np.array(state["sigma"])
+        self.rng.bit_generator.state = state["rng"]
+        self.best = state["best"]
+        self.history = state["history"]
+
+
+def tune(tuner:Tuner, generations:int, output:str, checkpoint:str=None, workers:int=None, memo_size:int=None):
+    """Run a tuner until it has completed a number of generations, resuming from the checkpoint if it exists. The
+    checkpoint and the profile of the best mean so far are written after every generation.
+
+    :param workers: Number of worker processes (None -> number of CPUs, 1 -> play in this process).
+    :param memo_size: Maximum cached rows of the move engines of frame sizes above 4 in every process (None ->
+        row_engine.DEFAULT_MEMO_SIZE, about 300 bytes per row).
+    :return: profile of the best mean
+    """
+    if checkpoint is not None and os.path.exists(checkpoint):
+        tuner.load_checkpoint(checkpoint)
+        print(f"resumed at generation {tuner.generation}")
+
+    row_engine.set_memo_size(memo_size)
+    pool = None
+    if workers != 1:
+        pool = Pool(processes=workers, initializer=row_engine.set_memo_size, initargs=(memo_size,))
+    try:
+        while tuner.generation < generations:
+            record = tuner.step(pool)
+            if checkpoint is not None:
+                tuner.save_checkpoint(checkpoint)
+            save_profile(output, tuner.best)
+
+            games = tuner.config["games"] * (tuner.config["population"] + 1)
+            print(f"generation {record['generation']:>4}  mean {record['mean_score']:>8.0f}  "
+                  f"best candidate {record['best_candidate_score']:>8.0f}  population {record['population_score']:>8.0f}"
+                  f"  {games / record['duration']:.1f} games/s")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return tuner.best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the weights of the 2048 agent search with an evolution strategy.")
+    parser.add_argument("output", help="Agent profile (JSON) to write the best weights to.")
+    parser.add_argument("--search-mode", choices=sorted(PARAMETERS), default='greedy', help="Search mode to tune.")
+    parser.add_argument("--depth", type=int, default=2, help="Search depth of the agent.")
+    parser.add_argument("--generations", type=int, default=20, help="Total number of generations.")
+    parser.add_argument("--population", type=int, default=8, help="Sampled candidates per generation.")
+    parser.add_argument("--parents", type=int, default=None, help="Best candidates forming the next mean.")
+    parser.add_argument("--games", type=int, default=8, help="Games per candidate and generation.")
+    parser.add_argument("--sigma", type=float, default=0.3, help="Initial step size relative to the default weights.")
+    parser.add_argument("--frame-size", type=int, default=4, help="Size of the game frame.")
+    parser.add_argument("--max-moves", type=int, default=0, help="Maximum moves per game (0 -> unlimited).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampling and the games.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--checkpoint", help="Checkpoint file, the tuning resumes from it if it exists.")
+    parser.add_argument("--row-memo", type=int, default=None,
+                        help="Cached rows of the move engine per process for frames above 4x4 (~300 bytes each).")
+    args = parser.parse_args()
+
+    tuner = Tuner(search_mode=args.search_mode, depth=args.depth, population=args.population, parents=args.parents,
+                  games=args.games, sigma=args.sigma, frame_size=args.frame_size, max_moves=args.max_moves,
+                  seed=args.seed)
+    best = tune(tuner, args.generations, args.output, checkpoint=args.checkpoint, workers=args.workers,
+                memo_size=args.row_memo)
+    print(json.dumps(best, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
+import argparse
 import tkinter as tk
+
+from agent import load_profile
 from frame import Frame
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Play 2048.")
+    parser.add_argument("--profile", help="Agent profile (e.g. written by tuning.py) for the AI auto play.")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    frame = Frame(root)
+    frame = Frame(root, profile=load_profile(args.profile) if args.profile else None)
     root.mainloop()
 
 